@@ -0,0 +1,49 @@
+"""Сравнение времени БПФ для «неудобных» длин записи и длин, выбранных планировщиком
+
+Запуск: python bench_fft_planner.py
+"""
+import time
+
+import numpy as np
+
+from eeg_dsp import next_fast_len, prev_fast_len
+
+
+def largest_prime_factor(n):
+    factor, largest = 2, 1
+    while factor * factor <= n:
+        while n % factor == 0:
+            largest, n = factor, n // factor
+        factor += 1
+    return max(largest, n) if n > 1 else largest
+
+
+def best_time(n, repeats=3):
+    signal = np.random.default_rng(0).standard_normal(n)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        np.fft.rfft(signal)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    # Длительности около 10 минут при 250 Гц и около 1 минуты при 5000 Гц
+    lengths = [150001, 150011, 150013, 149993, 299993, 300007, 299999]
+    worst = 0.0
+
+    print(f"{'N':>8} {'макс. простой':>14} {'t(N), мс':>10} {'pad':>8} {'t, мс':>8} {'trim':>8} {'t, мс':>8} {'ускорение':>10}")
+    for n in lengths:
+        pad, trim = next_fast_len(n), prev_fast_len(n)
+        t_raw, t_pad, t_trim = best_time(n), best_time(pad), best_time(trim)
+        speedup = t_raw / min(t_pad, t_trim)
+        worst = max(worst, speedup)
+        print(f"{n:>8} {largest_prime_factor(n):>14} {t_raw * 1e3:>10.2f} {pad:>8} {t_pad * 1e3:>8.2f} "
+              f"{trim:>8} {t_trim * 1e3:>8.2f} {speedup:>9.1f}x")
+
+    print(f"\nМаксимальное ускорение: {worst:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
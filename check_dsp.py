@@ -0,0 +1,198 @@
+"""Численная проверка собственной обработки сигналов eeg_dsp по прямым эталонным реализациям
+
+Фильтры сравниваются с поотсчетной прямой формой, блочная обработка - с обработкой целиком,
+дециматор - с полной сверткой, накопленные периодограммы - с обычным усреднением Уэлча.
+Запуск: python check_dsp.py (при расхождении - AssertionError)
+"""
+import tempfile
+
+import numpy as np
+
+from eeg_dsp import (PolyphaseDecimator, SegmentSpectra, SosFilter, butter_sos, design_filter_sos, filter_recording,
+                     next_fast_len, notch_sos, zoom_psd)
+
+
+def check_close(name, actual, expected, tolerance):
+    """Максимальная ошибка относительно размаха эталона; печатается и сравнивается с допуском"""
+    actual, expected = np.asarray(actual), np.asarray(expected)
+    assert actual.shape == expected.shape, f"{name}: форма {actual.shape}, ожидалась {expected.shape}"
+    error = np.max(np.abs(actual - expected)) / max(np.max(np.abs(expected)), 1e-300)
+    print(f"{name:<68} {error:.1e}")
+    assert error <= tolerance, f"{name}: относительная ошибка {error:.2e} больше {tolerance:.0e}"
+
+
+def direct_form_filter(sos, x, state=None):
+    """Эталон: поотсчетная прямая транспонированная форма II, секция за секцией (отсчеты × каналы)"""
+    y = np.array(x, dtype=float)
+    for i, (b0, b1, b2, _, a1, a2) in enumerate(sos):
+        z1, z2 = (np.zeros(y.shape[1]), np.zeros(y.shape[1])) if state is None else np.copy(state[i])
+        for n in range(y.shape[0]):
+            xn = y[n].copy()
+            y[n] = b0 * xn + z1
+            z1 = b1 * xn - a1 * y[n] + z2
+            z2 = b2 * xn - a2 * y[n]
+    return y
+
+
+def sos_response(sos, freqs, fs):
+    """Комплексная частотная характеристика каскада секций"""
+    z = np.exp(-2j * np.pi * freqs / fs)
+    response = np.ones(len(freqs), dtype=complex)
+    for b0, b1, b2, a0, a1, a2 in sos:
+        response *= (b0 + b1 * z + b2 * z ** 2) / (a0 + a1 * z + a2 * z ** 2)
+    return response
+
+
+def check_butterworth():
+    """АЧХ Баттерворта после билинейного преобразования: |H|² = 1 / (1 + (tg(πf/fs) / tg(πfc/fs))^±2N)"""
+    fs = 250.0
+    freqs = np.linspace(0.1, fs / 2 - 0.1, 500)
+    ratio = np.tan(np.pi * freqs / fs)
+    for order in (3, 4):
+        for cutoff, btype in ((0.5, 'highpass'), (45.0, 'lowpass')):
+            power = 1 / (1 + (ratio / np.tan(np.pi * cutoff / fs)) ** (2 * order * (1 if btype == 'lowpass' else -1)))
+            actual = np.abs(sos_response(butter_sos(order, cutoff, fs, btype), freqs, fs))
+            check_close(f"butter_sos {btype} {cutoff:g} Гц, порядок {order}: АЧХ", actual, np.sqrt(power), 1e-9)
+
+    response = np.abs(sos_response(notch_sos(50.0, fs), np.array([0.0, 50.0, fs / 2 - 1e-9]), fs))
+    check_close("notch_sos 50 Гц: 1 на 0 и Найквисте, 0 на 50 Гц", response, [1.0, 0.0, 1.0], 1e-9)
+
+
+def check_sos_filter():
+    """SosFilter (свертка блоков через БПФ) против поотсчетной прямой формы, с начальным состоянием и без"""
+    fs = 250.0
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((3000, 3)) + 40.0
+    sos = design_filter_sos(fs, highpass=0.5, lowpass=45.0, notch=50.0)
+
+    sos_filter = SosFilter(sos, block_size=256)
+    check_close("SosFilter против прямой формы (нулевое состояние)", sos_filter.process(x),
+                direct_form_filter(sos, x), 1e-10)
+
+    sos_filter = SosFilter(sos, block_size=256)
+    sos_filter.initialize(x[0])
+    reference = direct_form_filter(sos, x, sos_filter.state)
+    check_close("SosFilter против прямой формы (установившееся состояние)", sos_filter.process(x), reference, 1e-10)
+
+    # Установившееся состояние для постоянного входа: выход постоянен с первого отсчета
+    constant = np.full((500, 2), 7.0)
+    sos_filter = SosFilter(butter_sos(4, 45.0, fs), block_size=64)
+    sos_filter.initialize(constant[0])
+    check_close("SosFilter.initialize: ФНЧ постоянного входа без переходного процесса",
+                sos_filter.process(constant), constant, 1e-10)
+
+
+def check_chunked_filtering():
+    """Фильтрация кусками произвольной длины и filter_recording по memmap совпадают с фильтрацией целиком"""
+    fs = 250.0
+    rng = np.random.default_rng(2)
+    x = rng.standard_normal((5000, 2)).cumsum(axis=0)
+    sos = design_filter_sos(fs, highpass=0.5, lowpass=30.0)
+
+    whole_filter = SosFilter(sos, block_size=512)
+    whole_filter.initialize(x[0])
+    whole = whole_filter.process(x)
+
+    chunked_filter = SosFilter(sos, block_size=512)
+    chunked_filter.initialize(x[0])
+    bounds = np.concatenate(([0], np.cumsum([1, 2, 511, 512, 513, 1000, 7]), [len(x)]))
+    chunked = np.concatenate([chunked_filter.process(x[a:b]) for a, b in zip(bounds[:-1], bounds[1:])])
+    check_close("SosFilter кусками 1, 2, 511, 512, 513, ... против целиком", chunked, whole, 1e-10)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        source = np.lib.format.open_memmap(f"{cache_dir}/source.npy", mode='w+', dtype=np.float64, shape=x.shape)
+        source[:] = x
+        source.flush()
+        recording_filter = SosFilter(sos, block_size=512)
+        recording_filter.initialize(x[0])
+        filtered = filter_recording(recording_filter, source, cache_dir, tag='check', block_rows=777)
+        check_close("filter_recording по memmap блоками 777 против целиком", np.asarray(filtered), whole, 1e-10)
+        del filtered, source
+
+
+def check_decimator():
+    """Полифазный дециматор против полной свертки с тем же КИХ-фильтром и прореживания с его задержкой"""
+    rng = np.random.default_rng(3)
+    x = rng.standard_normal((20011, 2))
+    decimator = PolyphaseDecimator(5000, 250, passband=50.0)
+    delay = (len(decimator.taps) - 1) // 2
+    full = np.stack([np.convolve(x[:, c], decimator.taps) for c in range(x.shape[1])], axis=1)
+    reference = full[delay::decimator.factor][:-(-len(x) // decimator.factor)]
+
+    check_close("PolyphaseDecimator 5000->250 Гц против свертки", decimator.process(x), reference, 1e-10)
+    check_close("PolyphaseDecimator блоками по 7 выходных отсчетов", decimator.process(x, block_size=7),
+                reference, 1e-10)
+    check_close("PolyphaseDecimator 1-D сигнал", decimator.process(x[:, 0]), reference[:, 0], 1e-10)
+
+
+def plain_welch(x, fs, nperseg, step, nfft, keep):
+    """Эталон: среднее периодограмм сегментов (окно Ханна, без среднего) и взаимные спектры по циклу"""
+    window = np.hanning(nperseg)
+    scale = 1.0 / (fs * np.sum(window ** 2))
+    spectra = []
+    for s in np.flatnonzero(keep):
+        segment = x[s * step:s * step + nperseg]
+        spectra.append(np.fft.rfft((segment - segment.mean(axis=0)) * window[:, None], n=nfft, axis=0).T)
+    spectra = np.array(spectra)
+    psd = np.mean(np.abs(spectra) ** 2, axis=0) * scale
+    cross = np.einsum('scf,sdf->fcd', spectra, np.conj(spectra)) * scale / len(spectra)
+    return psd, cross
+
+
+def check_segment_spectra():
+    """SegmentSpectra.psd (разности накопленных сумм) против обычного усреднения Уэлча, с маской и без"""
+    fs = 250.0
+    nperseg = 500
+    step = nperseg // 2
+    rng = np.random.default_rng(4)
+    x = rng.standard_normal((100 * nperseg + 123, 3)) + 5.0
+    nfft = next_fast_len(nperseg)
+    n_segments = 1 + (len(x) - nperseg) // step
+    mask = rng.random(n_segments) > 0.3
+    mask[70:140] = False  # Несколько блоков целиком исключены
+
+    for name, segment_mask in (("без маски", None), ("с маской", mask)):
+        spectra = SegmentSpectra(x, fs, nperseg, chunk_segments=16, block_segments=32,
+                                 segment_mask=segment_mask, cross_channels=2)
+        keep = np.ones(n_segments, dtype=bool) if segment_mask is None else segment_mask
+        n_bins = len(spectra.freqs)
+        for first, last in ((0, n_segments), (5, 37), (31, 33), (60, 150)):
+            psd, _ = plain_welch(x, fs, nperseg, step, nfft, keep & (np.arange(n_segments) >= first)
+                                 & (np.arange(n_segments) < last))
+            check_close(f"SegmentSpectra.psd({first}, {last}) {name}", spectra.psd(first, last), psd[:, :n_bins], 1e-5)
+
+        _, cross = plain_welch(x[:, :2], fs, nperseg, step, nfft, keep)
+        freqs, actual = spectra.cross_spectra()
+        check_close(f"SegmentSpectra.cross_spectra {name}", actual, cross[:n_bins], 1e-10)
+        check_close(f"Диагональ cross_spectra = psd {name}", np.real(np.diagonal(actual, axis1=1, axis2=2)).T,
+                    spectra.psd(0, n_segments)[:2], 1e-5)
+
+
+def check_zoom_psd():
+    """zoom_psd против прямого вычисления спектра окна Ханна (ДВПФ) на той же сетке частот"""
+    fs = 5000.0
+    n = 30011
+    t = np.arange(n) / fs
+    rng = np.random.default_rng(5)
+    x = np.sin(2 * np.pi * 1.37 * t) + 0.5 * np.sin(2 * np.pi * 2.9 * t + 1.0) + 0.01 * rng.standard_normal(n)
+
+    freqs, actual = zoom_psd(x, fs, 0.5, 6.0)
+    window = np.hanning(n)
+    weighted = (x - x.mean()) * window
+    spectrum = np.exp(-2j * np.pi * np.outer(freqs, np.arange(n)) / fs) @ weighted
+    check_close("zoom_psd 0.5-6 Гц (прореживание + chirp-z) против ДВПФ", actual,
+                np.abs(spectrum) ** 2 / (fs * np.sum(window ** 2)), 1e-3)
+
+
+def main():
+    check_butterworth()
+    check_sos_filter()
+    check_chunked_filtering()
+    check_decimator()
+    check_segment_spectra()
+    check_zoom_psd()
+    print("\nВсе проверки пройдены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,820 @@
+import hashlib
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _smooth_length(n, above):
+    """Ближайшая к n длина вида 2^a·3^b·5^c·7^d (сверху или снизу)"""
+    best = None
+    p7 = 1
+    while p7 <= 2 * n:
+        p5 = p7
+        while p5 <= 2 * n:
+            p3 = p5
+            while p3 <= 2 * n:
+                # Остаток добираем степенью двойки
+                length = p3
+                if above:
+                    while length < n:
+                        length *= 2
+                    if best is None or length < best:
+                        best = length
+                elif length <= n:
+                    while length * 2 <= n:
+                        length *= 2
+                    if best is None or length > best:
+                        best = length
+                p3 *= 3
+            p5 *= 5
+        p7 *= 7
+    return best
+
+
+def next_fast_len(n):
+    """Наименьшая 2·3·5·7-гладкая длина БПФ не меньше n"""
+    return 1 if n <= 1 else _smooth_length(int(n), above=True)
+
+
+def prev_fast_len(n):
+    """Наибольшая 2·3·5·7-гладкая длина БПФ не больше n"""
+    return 1 if n <= 1 else _smooth_length(int(n), above=False)
+
+
+def plan_fft_length(n, mode='pad'):
+    """Длина преобразования для n отсчетов: дополнение нулями ('pad') или усечение записи ('trim')"""
+    if mode == 'trim':
+        return prev_fast_len(n)
+    return next_fast_len(n)
+
+
+def has_signal(signal):
+    """Достаточно ли отсчетов и не постоянный ли сигнал"""
+    return len(signal) >= 1000 and np.std(signal) >= 1e-10
+
+
+def compute_psd(signal, fs, fft_mode='pad'):
+    """Вычисление СПМ методом периодограммы с окном Ханна
+
+    Длина БПФ выбирается планировщиком: при 'pad' сигнал дополняется нулями до ближайшей
+    быстрой длины, при 'trim' усекается до нее (длины с большими простыми множителями
+    считаются в разы медленнее).
+    """
+    if not has_signal(signal):
+        return None, None
+
+    nfft = plan_fft_length(len(signal), fft_mode)
+    signal = np.asarray(signal[:nfft], dtype=float)
+    N = len(signal)
+
+    # Убираем постоянную составляющую и применяем окно Ханна
+    signal = signal - np.mean(signal)
+    window = np.hanning(N)
+    fft_result = np.fft.rfft(signal * window, n=nfft)
+
+    # Расчет СПМ с нормализацией на мощность окна
+    psd = (np.abs(fft_result) ** 2) / (fs * np.sum(window ** 2))
+    return np.fft.rfftfreq(nfft, 1 / fs), psd
+
+
+def compute_band_power(psd, freqs, f_low, f_high):
+    """Вычисление мощности в заданном частотном диапазоне"""
+    freq_mask = (freqs >= f_low) & (freqs <= f_high)
+    if np.any(freq_mask):
+        # По последней оси: годится и для массива спектров (..., частоты)
+        return np.trapezoid(psd[..., freq_mask], freqs[freq_mask], axis=-1)
+    # Ни одной частоты в диапазоне: нули той же формы, что и у непустого результата
+    return np.zeros(np.shape(psd)[:-1])[()]
+
+
+class SpectrumIntegral:
+    """Накопленный по частоте интеграл СПМ (трапеции): мощность любой полосы - разность двух значений
+
+    Дает то же, что compute_band_power, но полоса находится поиском по частотам, без прохода
+    по всему спектру, поэтому границы ритмов можно менять без пересчета. psd - (..., частоты).
+    """
+
+    def __init__(self, psd, freqs):
+        self.freqs = np.asarray(freqs, dtype=float)
+        psd = np.asarray(psd, dtype=float)
+        steps = (psd[..., 1:] + psd[..., :-1]) / 2 * np.diff(self.freqs)
+        self.cumulative = np.concatenate((np.zeros(psd.shape[:-1] + (1,)), np.cumsum(steps, axis=-1)), axis=-1)
+
+    def band_power(self, f_low, f_high):
+        lo = np.searchsorted(self.freqs, f_low, side='left')
+        hi = np.searchsorted(self.freqs, f_high, side='right') - 1
+        if hi < lo:
+            return np.zeros(self.cumulative.shape[:-1])[()]
+        return self.cumulative[..., hi] - self.cumulative[..., lo]
+
+
+def channel_spectra(signal, fs, zoom_band=None, zoom_oversample=4, fft_mode='pad'):
+    """Спектры одного канала для анализа периодограммой: СПМ и (опционально) zoom-спектр
+
+    Уэлч сюда не входит: его спектры берутся из накопленных периодограмм сегментов (SegmentSpectra).
+    """
+    freqs, psd = compute_psd(signal, fs, fft_mode)
+    if freqs is None or zoom_band is None:
+        return freqs, psd, None, None
+    zoom_freqs, zoom_values = zoom_psd(signal, fs, zoom_band[0], zoom_band[1], zoom_oversample)
+    return freqs, psd, zoom_freqs, zoom_values
+
+
+def design_lowpass_fir(fs, passband, stopband, attenuation_db=80.0):
+    """Проектирование линейно-фазового ФНЧ методом окна Кайзера"""
+    if not 0 < passband < stopband <= fs / 2:
+        raise ValueError(f"Некорректные границы фильтра: {passband}-{stopband} Гц при fs={fs} Гц")
+
+    # Порядок фильтра по формуле Кайзера
+    transition = (stopband - passband) / fs
+    numtaps = int(np.ceil((attenuation_db - 7.95) / (14.36 * transition))) + 1
+    if numtaps % 2 == 0:
+        numtaps += 1
+
+    if attenuation_db > 50:
+        beta = 0.1102 * (attenuation_db - 8.7)
+    elif attenuation_db >= 21:
+        beta = 0.5842 * (attenuation_db - 21) ** 0.4 + 0.07886 * (attenuation_db - 21)
+    else:
+        beta = 0.0
+
+    cutoff = (passband + stopband) / 2
+    n = np.arange(numtaps) - (numtaps - 1) / 2
+    taps = 2 * cutoff / fs * np.sinc(2 * cutoff / fs * n) * np.kaiser(numtaps, beta)
+
+    # Единичное усиление на нулевой частоте
+    return taps / np.sum(taps)
+
+
+def fir_response(taps, fs, nfft=1 << 16):
+    """Амплитудно-частотная характеристика КИХ-фильтра"""
+    response = np.abs(np.fft.rfft(taps, n=nfft))
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+    return freqs, response
+
+
+class PolyphaseDecimator:
+    """Полифазный дециматор с антиалиасинговым ФНЧ для всех каналов сразу"""
+
+    def __init__(self, fs, target_fs, passband=50.0, max_ripple_db=0.1, attenuation_db=80.0):
+        factor = fs / target_fs
+        if factor < 1 or abs(factor - round(factor)) > 1e-9:
+            raise ValueError(f"Частота {fs} Гц не делится нацело на {target_fs} Гц")
+        if passband >= target_fs / 2:
+            raise ValueError(f"Полоса пропускания {passband} Гц выходит за Найквиста {target_fs / 2} Гц")
+
+        self.fs = fs
+        self.target_fs = target_fs
+        self.factor = int(round(factor))
+        self.passband = passband
+        self.taps = design_lowpass_fir(fs, passband, target_fs / 2, attenuation_db)
+
+        # Проверяем фактическую АЧХ: пульсации в полосе и подавление выше Найквиста
+        freqs, response = fir_response(self.taps, fs)
+        pass_response = response[freqs <= passband]
+        self.passband_ripple_db = 20 * np.log10(np.max(pass_response) / np.min(pass_response))
+        self.stopband_attenuation_db = -20 * np.log10(np.max(response[freqs >= target_fs / 2]))
+        if self.passband_ripple_db > max_ripple_db:
+            raise ValueError(f"Пульсации в полосе 0-{passband} Гц: {self.passband_ripple_db:.3f} дБ "
+                             f"(допустимо {max_ripple_db} дБ)")
+
+    def process(self, data, block_size=1 << 12, progress=None):
+        """Фильтрация и прореживание (отсчеты × каналы); вычисляются только сохраняемые отсчеты
+
+        Фильтр раскладывается на factor полифазных ветвей по ceil(taps / factor) коэффициентов;
+        свертки всех ветвей и каналов блока - одно БПФ по блоку, уложенному в (отсчеты / factor, factor).
+        progress(готово, всего) вызывается после каждого блока выходных отсчетов.
+        """
+        data = np.asarray(data)
+        squeeze = data.ndim == 1
+        if squeeze:
+            data = data[:, None]
+
+        n, n_channels = data.shape
+        step = self.factor
+        delay = (len(self.taps) - 1) // 2
+        n_out = -(-n // step)
+        output = np.empty((n_out, n_channels))
+
+        # Ветви: h_r[q] = h[q*D + r]; столбец блока p соответствует ветви D - 1 - p
+        n_branch = -(-len(self.taps) // step)
+        branches = np.zeros(n_branch * step)
+        branches[:len(self.taps)] = self.taps
+        branches = branches.reshape(n_branch, step)[:, ::-1]
+        block_size = min(block_size, max(1, n_out))
+        nfft = next_fast_len(block_size + 2 * n_branch - 2)
+        branch_spectra = np.fft.rfft(branches, nfft, axis=0)
+
+        # Блоками по выходным отсчетам, чтобы не копировать всю запись целиком
+        for m0 in range(0, n_out, block_size):
+            m1 = min(n_out, m0 + block_size)
+            rows = m1 - m0 + n_branch - 1
+            # y[m] = sum_k h[k] * x[m*D + delay - k]: блок - входные отсчеты для выходов [m0 - Q + 1, m1)
+            lo = (m0 - n_branch + 1) * step + delay - step + 1
+            hi = lo + rows * step
+            chunk = np.zeros((hi - lo, n_channels))
+            src_lo, src_hi = max(lo, 0), min(hi, n)
+            if src_hi > src_lo:
+                chunk[src_lo - lo:src_hi - lo] = data[src_lo:src_hi]
+
+            spectra = np.fft.rfft(chunk.reshape(rows, step, n_channels), nfft, axis=0)
+            block = np.fft.irfft(np.einsum('fpc,fp->fc', spectra, branch_spectra), nfft, axis=0)
+            output[m0:m1] = block[n_branch - 1:n_branch - 1 + m1 - m0]
+            if progress is not None:
+                progress(m1, n_out)
+
+        return output[:, 0] if squeeze else output
+
+
+def butter_sos(order, cutoff, fs, btype='lowpass'):
+    """Фильтр Баттерворта (ФНЧ/ФВЧ) в виде каскада секций второго порядка [b0 b1 b2 1 a1 a2]
+
+    Аналоговый прототип переводится в цифровой билинейным преобразованием с предыскажением частоты.
+    """
+    if not 0 < cutoff < fs / 2:
+        raise ValueError(f"Частота среза {cutoff} Гц вне диапазона 0-{fs / 2} Гц")
+    highpass = btype == 'highpass'
+    warped = 2 * fs * np.tan(np.pi * cutoff / fs)
+    prototype = np.exp(1j * np.pi * (2 * np.arange(order) + order + 1) / (2 * order))
+    s_poles = warped / prototype if highpass else warped * prototype
+    z_poles = (2 * fs + s_poles) / (2 * fs - s_poles)
+
+    sections = []
+    # Комплексно-сопряженные пары полюсов - секции второго порядка, нечетный полюс - первого
+    for pole in z_poles[z_poles.imag > 1e-12]:
+        a = np.array([1.0, -2 * pole.real, abs(pole) ** 2])
+        b = np.array([1.0, -2.0, 1.0]) if highpass else np.array([1.0, 2.0, 1.0])
+        sections.append((b, a))
+    if order % 2:
+        pole = z_poles[np.argmin(np.abs(z_poles.imag))].real
+        a = np.array([1.0, -pole, 0.0])
+        b = np.array([1.0, -1.0, 0.0]) if highpass else np.array([1.0, 1.0, 0.0])
+        sections.append((b, a))
+
+    # Единичное усиление в полосе пропускания: на Найквисте для ФВЧ, на нуле для ФНЧ
+    z = -1.0 if highpass else 1.0
+    sos = np.empty((len(sections), 6))
+    for i, (b, a) in enumerate(sections):
+        gain = np.polyval(a[::-1], 1 / z) / np.polyval(b[::-1], 1 / z)
+        sos[i] = np.concatenate((b * gain, a))
+    return sos
+
+
+def notch_sos(freq, fs, quality=30.0):
+    """Режекторный фильтр второго порядка (сетевая помеха) в виде одной секции"""
+    if not 0 < freq < fs / 2:
+        raise ValueError(f"Частота режекции {freq} Гц вне диапазона 0-{fs / 2} Гц")
+    w0 = 2 * np.pi * freq / fs
+    alpha = np.sin(w0) / (2 * quality)
+    b = np.array([1.0, -2 * np.cos(w0), 1.0]) / (1 + alpha)
+    a = np.array([1.0, -2 * np.cos(w0) / (1 + alpha), (1 - alpha) / (1 + alpha)])
+    return np.concatenate((b, a))[None, :]
+
+
+def design_filter_sos(fs, highpass=None, lowpass=None, notch=None, order=4, notch_quality=30.0):
+    """Каскад фильтров: ФВЧ, ФНЧ (вместе - полосовой) и режекция; None - звено не используется"""
+    stages = []
+    if highpass:
+        stages.append(butter_sos(order, highpass, fs, 'highpass'))
+    if lowpass:
+        stages.append(butter_sos(order, lowpass, fs, 'lowpass'))
+    if notch:
+        stages.append(notch_sos(notch, fs, notch_quality))
+    return np.concatenate(stages) if stages else np.empty((0, 6))
+
+
+class SosFilter:
+    """Потоковый каузальный фильтр из секций второго порядка с состоянием по каналам
+
+    Блок обрабатывается каждой секцией точно, без поотсчетного цикла: отклик при нулевом состоянии -
+    свертка с импульсной характеристикой через БПФ, плюс свободный отклик от состояния
+    на начало блока. Результат не зависит от того, какими кусками подается запись.
+    """
+
+    def __init__(self, sos, block_size=4096):
+        self.sos = np.atleast_2d(np.asarray(sos, dtype=float))
+        self.block_size = block_size
+        self.nfft = next_fast_len(2 * block_size - 1)
+
+        # Для каждой секции: импульсная характеристика h = B/A и свободный отклик g = 1/A на блок
+        self.impulse = np.zeros((len(self.sos), block_size))
+        self.free = np.zeros((len(self.sos), block_size))
+        for i, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+            x = np.zeros(block_size + 2)
+            x[2] = 1.0
+            h = np.zeros(block_size + 2)
+            g = np.zeros(block_size + 2)
+            for n in range(2, block_size + 2):
+                h[n] = b0 * x[n] + b1 * x[n - 1] + b2 * x[n - 2] - a1 * h[n - 1] - a2 * h[n - 2]
+                g[n] = x[n] - a1 * g[n - 1] - a2 * g[n - 2]
+            self.impulse[i] = h[2:]
+            self.free[i] = g[2:]
+        self.impulse_spectrum = np.fft.rfft(self.impulse, self.nfft, axis=1)
+        self.state = None
+
+    def reset(self):
+        """Сброс состояния (начало новой записи)"""
+        self.state = None
+
+    def initialize(self, x0):
+        """Установившееся состояние для постоянного входа x0 (по каналам) - без переходного процесса на старте"""
+        x = np.atleast_1d(np.asarray(x0, dtype=float))
+        self.state = np.zeros((len(self.sos), 2, x.shape[0]))
+        for i, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+            y = x * (b0 + b1 + b2) / (1 + a1 + a2)
+            self.state[i, 1] = b2 * x - a2 * y
+            self.state[i, 0] = b1 * x - a1 * y + self.state[i, 1]
+            x = y
+
+    def process(self, chunk):
+        """Фильтрует очередной кусок (отсчеты × каналы или 1-D), продолжая с сохраненного состояния"""
+        chunk = np.asarray(chunk)
+        squeeze = chunk.ndim == 1
+        if squeeze:
+            chunk = chunk[:, None]
+        if self.state is None or self.state.shape[2] != chunk.shape[1]:
+            # Состояние прямой транспонированной формы II: (секция, z1/z2, канал)
+            self.state = np.zeros((len(self.sos), 2, chunk.shape[1]))
+
+        output = np.empty(chunk.shape)
+        for start in range(0, chunk.shape[0], self.block_size):
+            y = np.asarray(chunk[start:start + self.block_size], dtype=float)
+            m = y.shape[0]
+            for i, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+                x = y
+                if m == self.block_size:
+                    spectrum = self.impulse_spectrum[i]
+                else:
+                    spectrum = np.fft.rfft(self.impulse[i, :m], self.nfft)
+                y = np.fft.irfft(np.fft.rfft(x, self.nfft, axis=0) * spectrum[:, None], self.nfft, axis=0)[:m]
+
+                z1, z2 = self.state[i]
+                y += self.free[i, :m, None] * z1
+                y[1:] += self.free[i, :m - 1, None] * z2
+
+                # Состояние на конец блока по двум последним входам и выходам секции
+                z2_prev = b2 * x[-2] - a2 * y[-2] if m > 1 else z2
+                self.state[i, 0] = b1 * x[-1] - a1 * y[-1] + z2_prev
+                self.state[i, 1] = b2 * x[-1] - a2 * y[-1]
+            output[start:start + m] = y
+
+        return output[:, 0] if squeeze else output
+
+
+def zero_phase_filter(data, sos, padlen=0):
+    """Фильтрация вперед и назад (нулевой фазовый сдвиг) с нечетным отражением краев на padlen отсчетов"""
+    data = np.asarray(data, dtype=float)
+    padlen = min(padlen, data.shape[0] - 1)
+    if padlen > 0:
+        head = 2 * data[0] - data[padlen:0:-1]
+        tail = 2 * data[-1] - data[-2:-padlen - 2:-1]
+        data = np.concatenate((head, data, tail))
+
+    forward_filter = SosFilter(sos)
+    forward_filter.initialize(data[0])
+    forward = forward_filter.process(data)
+    backward_filter = SosFilter(sos)
+    backward_filter.initialize(forward[-1])
+    output = backward_filter.process(forward[::-1])[::-1]
+    return output[padlen:output.shape[0] - padlen] if padlen > 0 else output
+
+
+def band_limited_waveform(signal, fs, f_low, f_high, display_fs=50.0, order=4):
+    """Реальная форма ритма в полосе f_low-f_high без фазового сдвига, на частоте отображения display_fs
+
+    Запись прореживается до display_fs (для широкой полосы - чаще, не реже 4 * f_high, с целым
+    коэффициентом), затем полосовой фильтр Баттерворта применяется вперед и назад; при f_low = 0 - только ФНЧ.
+    Возвращает (волна, частота волны); отсчет m соответствует времени m / частота волны.
+    """
+    if not 0 <= f_low < f_high < fs / 2:
+        raise ValueError(f"Некорректная полоса {f_low}-{f_high} Гц для частоты {fs} Гц")
+    factor = max(1, int(fs // max(display_fs, 4 * f_high)))
+    display_fs = fs / factor
+    decimator = PolyphaseDecimator(fs, display_fs, passband=min(2 * f_high, 0.4 * display_fs))
+    decimated = decimator.process(signal)
+
+    # Крайние отсчеты искажены дополнением нулями в дециматоре (постоянная составляющая), продлеваем соседние
+    edge = -(-(len(decimator.taps) // 2) // decimator.factor)
+    if len(decimated) > 2 * edge:
+        decimated[:edge] = decimated[edge]
+        decimated[-edge:] = decimated[-edge - 1]
+    # Краевой переходный процесс длится порядка нескольких периодов нижней (при ФНЧ - верхней) границы
+    sos = design_filter_sos(display_fs, highpass=f_low, lowpass=f_high, order=order)
+    padlen = int(3 * display_fs / (f_low or f_high))
+    return zero_phase_filter(decimated, sos, padlen=padlen), display_fs
+
+
+def zoom_spectrum(x, fs, f_lo, f_hi, n_points):
+    """Спектр Фурье на равномерной сетке [f_lo, f_hi] через chirp-z преобразование (алгоритм Блюстейна)"""
+    x = np.asarray(x)
+    n = x.shape[0]
+    freqs = np.linspace(f_lo, f_hi, n_points)
+    df = (f_hi - f_lo) / (n_points - 1) if n_points > 1 else 0.0
+
+    def chirp(idx):
+        return np.exp(-1j * np.pi * df / fs * idx.astype(float) ** 2)
+
+    nn = np.arange(n)
+    kk = np.arange(n_points)
+    shape = (-1,) + (1,) * (x.ndim - 1)
+
+    # Перенос f_lo в ноль и умножение на чирп
+    y = x * (np.exp(-2j * np.pi * f_lo / fs * nn) * chirp(nn)).reshape(shape)
+
+    # Свертка с сопряженным чирпом через БПФ
+    nfft = next_fast_len(n + n_points - 1)
+    v = np.zeros(nfft, dtype=complex)
+    v[:n_points] = np.conj(chirp(kk))
+    if n > 1:
+        v[nfft - n + 1:] = np.conj(chirp(nn[1:][::-1]))
+
+    conv = np.fft.ifft(np.fft.fft(y, n=nfft, axis=0) * np.fft.fft(v).reshape(shape), axis=0)
+    return freqs, conv[:n_points] * chirp(kk).reshape(shape)
+
+
+def zoom_psd(signal, fs, f_lo, f_hi, oversample=4):
+    """СПМ периодограммы с окном Ханна на плотной сетке [f_lo, f_hi] (нормировка как в compute_psd)
+
+    Шаг сетки - fs / (oversample·N): в oversample раз мельче шага БПФ всей записи при любой ее длине.
+    Взвешенная окном запись сначала прореживается примерно до 4·f_hi, поэтому chirp-z считается
+    по отсчетам полосы, а не всей записи.
+    """
+    signal = np.asarray(signal, dtype=float)
+    n = len(signal)
+    window = np.hanning(n)
+    weighted = (signal - np.mean(signal)) * window
+    norm = fs * np.sum(window ** 2)
+
+    zoom_fs = fs
+    factor = int(fs // (4 * f_hi))
+    if factor >= 2:
+        # Сумма прореженной последовательности в полосе пропускания в factor раз меньше суммы исходной
+        zoom_fs = fs / factor
+        weighted = PolyphaseDecimator(fs, zoom_fs, passband=f_hi).process(weighted) * factor
+
+    n_points = int(np.ceil((f_hi - f_lo) * oversample * n / fs)) + 1
+    freqs, spectrum = zoom_spectrum(weighted, zoom_fs, f_lo, f_hi, n_points)
+    return freqs, np.abs(spectrum) ** 2 / norm
+
+
+def welch_segment_count(n_samples, nperseg, noverlap):
+    """Число целых сегментов Уэлча в записи"""
+    if n_samples < nperseg:
+        return 0
+    return 1 + (n_samples - nperseg) // (nperseg - noverlap)
+
+
+def welch_segments(data, nperseg, noverlap, chunk_segments=64, nfft=None, segment_mask=None):
+    """Поблочный проход по записи: (номера сегментов, БПФ сегментов [сегменты × каналы × частоты])
+
+    В памяти одновременно находится только один блок из chunk_segments сегментов по каждому каналу,
+    поэтому data может быть np.memmap любого размера. Сегменты, отмеченные False в segment_mask,
+    пропускаются (блоки без хороших сегментов даже не читаются).
+    """
+    step = nperseg - noverlap
+    window = np.hanning(nperseg)
+    n_segments = welch_segment_count(data.shape[0], nperseg, noverlap)
+
+    for s0 in range(0, n_segments, chunk_segments):
+        s1 = min(n_segments, s0 + chunk_segments)
+        keep = np.ones(s1 - s0, dtype=bool) if segment_mask is None else segment_mask[s0:s1]
+        if not np.any(keep):
+            continue
+
+        chunk = np.asarray(data[s0 * step:(s1 - 1) * step + nperseg], dtype=float)
+        if chunk.ndim == 1:
+            chunk = chunk[:, None]
+
+        # Сегменты с перекрытием без копирования, затем удаление среднего и окно Ханна
+        segments = sliding_window_view(chunk, nperseg, axis=0)[::step][keep]
+        segments = segments - np.mean(segments, axis=-1, keepdims=True)
+        yield np.arange(s0, s1)[keep], np.fft.rfft(segments * window, n=nfft or nperseg, axis=-1)
+
+
+class SegmentSpectra:
+    """Периодограммы сегментов Уэлча всей записи (0-max_freq Гц), накопленные по времени
+
+    Периодограммы считаются один раз; средняя СПМ любого диапазона целых сегментов - разность
+    двух строк накопленной суммы, без новых БПФ и за постоянное время. Суммы хранятся во float32
+    внутри блоков по block_segments сегментов, а начала блоков - во float64, поэтому разность
+    не теряет точность и в суточной записи. Сегменты, отмеченные False в segment_mask,
+    в суммы не входят. Нормировка как в compute_psd.
+
+    Для первых cross_channels каналов в том же проходе по тем же БПФ сегментов накапливается
+    матрица взаимных спектров всей записи (см. cross_spectra). progress(готово, всего сегментов)
+    вызывается после каждого блока.
+    """
+
+    def __init__(self, data, fs, nperseg, noverlap=None, max_freq=50.0, chunk_segments=64,
+                 segment_mask=None, block_segments=256, cross_channels=0, progress=None):
+        if noverlap is None:
+            noverlap = nperseg // 2
+        self.fs = fs
+        self.nperseg = nperseg
+        self.step = nperseg - noverlap
+        self.block_segments = block_segments // chunk_segments * chunk_segments or chunk_segments
+        nfft = next_fast_len(nperseg)
+        freqs = np.fft.rfftfreq(nfft, 1 / fs)
+        n_bins = np.searchsorted(freqs, max_freq, side='right')
+        self.freqs = freqs[:n_bins]
+        self.scale = scale = 1.0 / (fs * np.sum(np.hanning(nperseg) ** 2))
+
+        self.n_segments = welch_segment_count(data.shape[0], nperseg, noverlap)
+        n_channels = data.shape[1]
+        self.local = np.zeros((self.n_segments + 1, n_channels, n_bins), dtype=np.float32)
+        self.base = np.zeros((self.n_segments // self.block_segments + 1, n_channels, n_bins))
+        self.counts = np.zeros(self.n_segments + 1, dtype=np.int64)  # Число вошедших сегментов с начала
+        self.total = np.zeros((n_channels, n_bins))
+        self.done = 0
+        cross_channels = min(cross_channels, n_channels)
+        self.cross = np.zeros((n_bins, cross_channels, cross_channels), dtype=complex)
+
+        for indices, spectra in welch_segments(data, nperseg, noverlap, chunk_segments, nfft, segment_mask):
+            s0 = indices[0] // chunk_segments * chunk_segments
+            s1 = min(self.n_segments, s0 + chunk_segments)
+            # Блоки, целиком исключенные маской, welch_segments пропускает
+            while self.done < s0:
+                gap = min(chunk_segments, s0 - self.done)
+                self.append(np.zeros((gap, n_channels, n_bins)), np.zeros(gap, dtype=bool))
+            spectra = spectra[..., :n_bins]
+            power = np.zeros((s1 - s0, n_channels, n_bins))
+            power[indices - s0] = np.abs(spectra) ** 2 * scale
+            if cross_channels:
+                cross = spectra[:, :cross_channels]
+                self.cross += np.einsum('scf,sdf->fcd', cross, np.conj(cross))
+            keep = np.zeros(s1 - s0, dtype=bool)
+            keep[indices - s0] = True
+            self.append(power, keep)
+            if progress is not None:
+                progress(self.done, self.n_segments)
+        while self.done < self.n_segments:
+            gap = min(chunk_segments, self.n_segments - self.done)
+            self.append(np.zeros((gap, n_channels, n_bins)), np.zeros(gap, dtype=bool))
+
+    def append(self, power, keep):
+        """Добавляет периодограммы следующих сегментов (блок не пересекает границу блока сумм)"""
+        rows = np.arange(self.done + 1, self.done + len(power) + 1)
+        sums = self.total + np.cumsum(power, axis=0)
+        starts = rows % self.block_segments == 0
+        self.base[rows[starts] // self.block_segments] = sums[starts]
+        self.local[rows] = sums - self.base[rows // self.block_segments]
+        self.counts[rows] = self.counts[self.done] + np.cumsum(keep)
+        self.total = sums[-1]
+        self.done = rows[-1]
+
+    def __len__(self):
+        return self.n_segments
+
+    def segment_ranges(self, starts, stops):
+        """Диапазоны целых сегментов [первый, последний + 1) внутри отсчетов [starts, stops) (массивы)"""
+        starts = np.asarray(starts, dtype=float)
+        stops = np.asarray(stops, dtype=float)
+        first = np.clip(np.ceil(starts / self.step), 0, self.n_segments).astype(int)
+        last = np.clip(np.floor((stops - self.nperseg) / self.step) + 1, 0, self.n_segments).astype(int)
+        return first, np.maximum(first, last)
+
+    def segment_range(self, start, stop):
+        """Сегменты, целиком лежащие в отсчетах [start, stop): (первый, последний + 1)
+
+        Если участок короче сегмента, берется один сегмент, ближайший к середине участка.
+        """
+        first, last = (int(v) for v in self.segment_ranges(start, stop))
+        if last <= first:
+            center = (start + stop) / 2 - self.nperseg / 2
+            first = int(np.clip(round(center / self.step), 0, self.n_segments - 1))
+            last = first + 1
+        return first, last
+
+    def segment_count(self, first, last):
+        """Число сегментов диапазона, вошедших в суммы (без исключенных маской)"""
+        return self.counts[last] - self.counts[first]
+
+    def prefix(self, index):
+        """Накопленная сумма периодограмм сегментов [0, index) (каналы × частоты, float64)"""
+        index = np.asarray(index)
+        return self.base[index // self.block_segments] + self.local[index]
+
+    def cross_spectra(self):
+        """Матрица взаимных спектров всей записи [частоты × каналы × каналы] или (None, None) без сегментов
+
+        Диагональ совпадает с psd(0, len(self)) для тех же каналов.
+        """
+        count = self.counts[-1]
+        if count == 0:
+            return None, None
+        return self.freqs, self.cross * (self.scale / count)
+
+    def psd(self, first, last):
+        """Средняя СПМ сегментов [first, last) по всем каналам; для массивов диапазонов - по каждому
+
+        Возвращает (каналы × частоты) или (диапазоны × каналы × частоты); без вошедших сегментов - NaN.
+        """
+        count = np.asarray(self.segment_count(first, last), dtype=float)[..., None, None]
+        total = self.prefix(last) - self.prefix(first)
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def _parse_asc_block(lines, n_columns):
+    values = np.array(" ".join(lines).split(), dtype=float)
+    if values.size != len(lines) * n_columns:
+        raise ValueError("Строки файла содержат разное число каналов")
+    return values.reshape(-1, n_columns)
+
+
+def default_cache_dir():
+    """Каталог бинарного кэша записей: EEG_CACHE_DIR или ~/.cache/eeg_analyzer
+
+    Не временный каталог системы: /tmp часто размещен в памяти (tmpfs), а кэш суточной записи - десятки ГБ.
+    """
+    return os.environ.get('EEG_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'eeg_analyzer')
+
+
+def evict_recording_cache(cache_dir, max_bytes, keep=()):
+    """Удаляет самые давно использованные файлы кэша записей, пока их общий размер больше max_bytes"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('eeg_') and name.endswith('.npy') and path not in keep:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries) + sum(os.path.getsize(path) for path in keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            # Файл может быть еще открыт (memmap прошлой записи в Windows)
+            print(f"Не удалось удалить файл кэша {path}: {e}")
+
+
+def load_asc_recording(path, cache_dir=None, block_lines=100000, max_cache_bytes=64 << 30):
+    """Загрузка .asc через бинарный кэш .npy, открываемый как np.memmap
+
+    Файл разбирается блоками по block_lines строк, так что запись целиком в памяти не находится.
+    Кэш привязан к пути, размеру и времени изменения файла и переиспользуется при повторной загрузке;
+    время изменения файла кэша отмечает последнее использование, и самые старые файлы удаляются,
+    когда кэш превышает max_cache_bytes.
+    """
+    stat = os.stat(path)
+    key = hashlib.md5(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+    cache_dir = cache_dir or default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"eeg_{key}.npy")
+
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+    else:
+        # Первый проход: число строк данных и каналов
+        n_rows, n_columns = 0, None
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith(';') or not line.strip():
+                    continue
+                if n_columns is None:
+                    n_columns = len(line.split())
+                n_rows += 1
+        if n_rows == 0:
+            raise ValueError("В файле нет данных")
+
+        # Второй проход: разбор блоками прямо в файл кэша
+        part_path = cache_path + '.part'
+        output = None
+        try:
+            output = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.float64, shape=(n_rows, n_columns))
+            row = 0
+            block = []
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.startswith(';') or not line.strip():
+                        continue
+                    block.append(line)
+                    if len(block) == block_lines:
+                        output[row:row + len(block)] = _parse_asc_block(block, n_columns)
+                        row += len(block)
+                        block = []
+            if block:
+                output[row:row + len(block)] = _parse_asc_block(block, n_columns)
+            output.flush()
+            output = None
+            os.replace(part_path, cache_path)
+        finally:
+            # Недописанный файл после ошибки разбора не остается (отображение закрывается до удаления)
+            output = None
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    evict_recording_cache(cache_dir, max_cache_bytes, keep=(cache_path,))
+    return np.load(cache_path, mmap_mode='r')
+
+
+def filter_recording(sos_filter, data, cache_dir=None, tag='', block_rows=1 << 18, max_cache_bytes=64 << 30, progress=None):
+    """Фильтрует запись блоками по block_rows отсчетов, продолжая состояние sos_filter
+
+    Запись на диске (np.memmap) фильтруется в файл кэша .npy рядом с ней и открывается как memmap,
+    так что полная отфильтрованная копия не держится в памяти. Файл привязан к исходному файлу и tag
+    (параметры фильтра) и удаляется вместе с остальным кэшем по давности использования.
+    progress(готово, всего отсчетов) вызывается после каждого блока.
+    """
+    if cache_dir is None or not isinstance(data, np.memmap) or data.filename is None:
+        output = np.empty(data.shape)
+        for start in range(0, data.shape[0], block_rows):
+            output[start:start + block_rows] = sos_filter.process(data[start:start + block_rows])
+            if progress is not None:
+                progress(min(start + block_rows, data.shape[0]), data.shape[0])
+        return output
+
+    key = hashlib.md5(f"{data.filename}|{data.offset}|{data.shape}|{tag}".encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"eeg_{key}.npy")
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+    else:
+        part_path = cache_path + '.part'
+        output = None
+        try:
+            output = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.float64, shape=data.shape)
+            for start in range(0, data.shape[0], block_rows):
+                output[start:start + block_rows] = sos_filter.process(data[start:start + block_rows])
+                if progress is not None:
+                    progress(min(start + block_rows, data.shape[0]), data.shape[0])
+            output.flush()
+            output = None
+            os.replace(part_path, cache_path)
+        finally:
+            output = None
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    evict_recording_cache(cache_dir, max_cache_bytes, keep=(cache_path, data.filename))
+    return np.load(cache_path, mmap_mode='r')
+
+
+def coherence_from_csd(csd):
+    """Квадрат когерентности и мнимая часть когерентности из матрицы взаимных спектров"""
+    power = np.real(np.diagonal(csd, axis1=-2, axis2=-1))
+    norm = np.sqrt(power[..., :, None] * power[..., None, :])
+    coherency = np.divide(csd, norm, out=np.zeros_like(csd), where=norm > 0)
+    return np.abs(coherency) ** 2, np.imag(coherency)
+
+
+def band_average_csd(csd, freqs, f_low, f_high):
+    """Средняя по диапазону частот матрица взаимных спектров [каналы × каналы]"""
+    mask = (freqs >= f_low) & (freqs <= f_high)
+    if not np.any(mask):
+        return np.zeros(csd.shape[1:], dtype=csd.dtype)
+    return np.mean(csd[mask], axis=0)
+
+
+def detect_artifacts(data, fs, epoch_seconds=2.0, max_ptp=500.0, flat_ptp=0.5, max_flat_fraction=0.2,
+                     max_clip_fraction=0.05, chunk_epochs=32):
+    """Разметка эпох с артефактами по всем каналам сразу
+
+    Для каждой эпохи и канала считаются размах, дисперсия, доля плоских участков (окна по 0.1 сек
+    с размахом меньше flat_ptp, например выпадение сигнала в ноль) и доля отсчетов на экстремуме
+    эпохи (клиппинг).
+    Возвращает компактную маску плохих эпох (эпоха плохая, если плохой хотя бы один канал)
+    и словарь метрик [эпохи × каналы].
+    """
+    epoch_len = int(round(epoch_seconds * fs))
+    flat_len = max(1, int(0.1 * fs))
+    n_flat = epoch_len // flat_len
+    n_epochs = data.shape[0] // epoch_len
+    n_channels = data.shape[1]
+    metrics = {name: np.empty((n_epochs, n_channels))
+               for name in ('ptp', 'variance', 'flat_fraction', 'clip_fraction')}
+
+    # Один векторизованный проход блоками эпох [эпохи × отсчеты × каналы]
+    for e0 in range(0, n_epochs, chunk_epochs):
+        e1 = min(n_epochs, e0 + chunk_epochs)
+        epochs = np.asarray(data[e0 * epoch_len:e1 * epoch_len], dtype=float).reshape(e1 - e0, epoch_len, n_channels)
+        low = np.min(epochs, axis=1)
+        high = np.max(epochs, axis=1)
+
+        metrics['ptp'][e0:e1] = high - low
+        metrics['variance'][e0:e1] = np.var(epochs, axis=1)
+        windows = epochs[:, :n_flat * flat_len].reshape(e1 - e0, n_flat, flat_len, n_channels)
+        flat = np.max(windows, axis=2) - np.min(windows, axis=2) < flat_ptp
+        metrics['flat_fraction'][e0:e1] = np.mean(flat, axis=1)
+        at_rail = (epochs == high[:, None, :]) | (epochs == low[:, None, :])
+        metrics['clip_fraction'][e0:e1] = np.mean(at_rail, axis=1)
+
+    bad = ((metrics['ptp'] > max_ptp)
+           | (metrics['flat_fraction'] > max_flat_fraction)
+           | (metrics['clip_fraction'] > max_clip_fraction))
+    metrics['bad'] = bad
+    return np.any(bad, axis=1), metrics
+
+
+def segment_mask_from_epochs(bad_epochs, epoch_seconds, fs, n_samples, nperseg, noverlap):
+    """Маска сегментов Уэлча (True - использовать), исключающая сегменты, задевающие плохие эпохи"""
+    step = nperseg - noverlap
+    epoch_len = epoch_seconds * fs
+    starts = np.arange(welch_segment_count(n_samples, nperseg, noverlap)) * step
+
+    # Число плохих эпох среди перекрытых сегментом через накопленную сумму
+    bad_count = np.concatenate(([0], np.cumsum(bad_epochs)))
+    first = np.minimum((starts // epoch_len).astype(int), len(bad_epochs))
+    last = np.minimum(((starts + nperseg - 1) // epoch_len).astype(int) + 1, len(bad_epochs))
+    return bad_count[last] - bad_count[first] == 0
@@ -0,0 +1,162 @@
+import mmap
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+# Подключенная в рабочем процессе запись: (описание источника, сегмент общей памяти или None, массив)
+_attached = None
+
+
+def _warmup():
+    """Пустая задача для запуска рабочих процессов и импорта numpy заранее"""
+    import eeg_dsp  # noqa: F401
+    return os.getpid()
+
+
+def _shared_array(source):
+    """Массив записи в рабочем процессе (подключение один раз на запись)"""
+    global _attached
+    if _attached is None or _attached[0] != source:
+        if _attached is not None and _attached[1] is not None:
+            _attached[1].close()
+        kind, name, offset, shape, dtype = source
+        if kind == 'memmap':
+            # Файл уже разделяется через страничный кэш ОС, копировать его не нужно
+            _attached = (source, None, np.memmap(name, dtype=dtype, mode='r', offset=offset, shape=shape))
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            _attached = (source, shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return _attached[2]
+
+
+def _run_channel_job(func, source, channel, args):
+    """Задача по одному каналу: данные берутся из общей памяти или memmap без копирования"""
+    data = _shared_array(source)
+    return func(data[:, channel], *args)
+
+
+class ChannelBatch:
+    """Набор поканальных задач; результаты забираются по мере готовности"""
+
+    def __init__(self, futures):
+        self.futures = futures  # канал -> Future
+        self.results = {}
+
+    def poll(self):
+        """Возвращает [(канал, результат)] для задач, завершившихся с прошлого вызова"""
+        ready = []
+        for channel, future in list(self.futures.items()):
+            if future.done():
+                del self.futures[channel]
+                self.results[channel] = future.result()
+                ready.append((channel, self.results[channel]))
+        return ready
+
+    def done(self):
+        return not self.futures
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+
+
+class JobCancelled(Exception):
+    """Фоновая задача отменена (прерывается на ближайшем отчете о ходе работы)"""
+
+
+class BackgroundJob:
+    """Задача в фоновом потоке; ход работы и результат забираются в потоке Tk опросом
+
+    func(job, *args) сообщает о ходе работы через job.report(готово, всего): там же
+    прерывается отмененная задача.
+    """
+
+    def __init__(self, func, *args):
+        self.stage = ''  # Текущий этап (для строки состояния)
+        self.progress = None  # (готово, всего) последнего отчета
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.run, args=(func, args), daemon=True)
+        self.thread.start()
+
+    def run(self, func, args):
+        try:
+            self.result = func(self, *args)
+        except JobCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+
+    def report(self, done, total):
+        if self.cancelled:
+            raise JobCancelled()
+        self.progress = (done, total)
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class AnalysisPool:
+    """Постоянный пул процессов для поканальных спектральных расчетов"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        # Трекер общей памяти запускается до рабочих процессов, чтобы он был у них общим
+        # с главным процессом и не удалял сегменты повторно при их завершении
+        if os.name == 'posix':
+            resource_tracker.ensure_running()
+
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.shm = None
+        self.shared_source = None
+
+        # Прогрев: все рабочие процессы стартуют сразу, а не при первом анализе
+        for _ in range(self.max_workers):
+            self.executor.submit(_warmup)
+
+    def share(self, data):
+        """Размещает запись (отсчеты × каналы) в общей памяти; повторно для того же массива не копирует"""
+        if self.shared_source is data:
+            return
+        self.release()
+
+        if isinstance(data, np.memmap) and isinstance(data.base, mmap.mmap):
+            # Запись на диске: рабочие процессы открывают тот же файл сами
+            self.shared_source = data
+            self.shared_meta = ('memmap', data.filename, data.offset, data.shape, data.dtype.str)
+            return
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        shared = np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf)
+        shared[:] = data
+        self.shared_source = data
+        self.shared_meta = ('shm', self.shm.name, 0, data.shape, data.dtype.str)
+
+    def map_channels(self, data, func, channels, *args):
+        """Запускает func(data[:, канал], *args) для каждого канала в рабочих процессах"""
+        self.share(data)
+        futures = {channel: self.executor.submit(_run_channel_job, func, self.shared_meta, channel, args)
+                   for channel in channels}
+        return ChannelBatch(futures)
+
+    def release(self):
+        """Освобождает общую память текущей записи"""
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+        self.shm = None
+        self.shared_source = None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.release()
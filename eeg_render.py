@@ -0,0 +1,866 @@
+import threading
+import time
+import tkinter as tk
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _bucket_envelope(low, high, start, stop, n_buckets):
+    """Минимум low и максимум high в каждой из n_buckets корзин участка [start, stop) в порядке следования"""
+    n = stop - start
+    bucket = -(-n // n_buckets)
+    n_full = n // bucket
+    end = start + n_full * bucket
+
+    low_blocks = np.asarray(low[start:end], dtype=float).reshape(n_full, bucket)
+    high_blocks = np.asarray(high[start:end], dtype=float).reshape(n_full, bucket) if high is not low else low_blocks
+    low_pos = np.argmin(low_blocks, axis=1)
+    high_pos = np.argmax(high_blocks, axis=1)
+    rows = np.arange(n_full)
+    low_values = low_blocks[rows, low_pos]
+    high_values = high_blocks[rows, high_pos]
+
+    # Минимум и максимум корзины идут в том порядке, в каком встречаются в сигнале
+    low_first = low_pos <= high_pos
+    positions = np.where(low_first[:, None], np.stack((low_pos, high_pos), axis=1),
+                         np.stack((high_pos, low_pos), axis=1))
+    values = np.where(low_first[:, None], np.stack((low_values, high_values), axis=1),
+                      np.stack((high_values, low_values), axis=1))
+    indices = (positions + start + bucket * rows[:, None]).ravel()
+    values = values.ravel()
+
+    # Неполная последняя корзина
+    if end < stop:
+        tail_low = np.asarray(low[end:stop], dtype=float)
+        tail_high = np.asarray(high[end:stop], dtype=float)
+        tail = sorted([(np.argmin(tail_low), tail_low.min()), (np.argmax(tail_high), tail_high.max())])
+        indices = np.concatenate((indices, [end + p for p, _ in tail]))
+        values = np.concatenate((values, [v for _, v in tail]))
+
+    return indices, values
+
+
+def envelope_decimate(signal, start, stop, max_points):
+    """Прореживание участка [start, stop) до max_points точек по min/max корзинам
+
+    В каждой корзине остаются минимум и максимум в порядке следования, поэтому пики
+    и выбросы сохраняются при любой длине участка. Возвращает (номера отсчетов, значения).
+    """
+    start = max(0, int(start))
+    stop = min(len(signal), int(stop))
+    n = stop - start
+    if n <= max(max_points, 2):
+        return np.arange(start, stop), np.asarray(signal[start:stop], dtype=float)
+    return _bucket_envelope(signal, signal, start, stop, max_points // 2)
+
+
+def spectrum_for_display(freqs, psd, f_low, f_high, max_points):
+    """Часть спектра в видимой полосе [f_low, f_high], прореженная до max_points точек с сохранением пиков
+
+    Полоса вырезается по отсортированным частотам (searchsorted, без масок по всему спектру);
+    прореживание - min/max огибающая, поэтому узкие пики не пропадают.
+    """
+    lo = np.searchsorted(freqs, f_low, side='left')
+    hi = np.searchsorted(freqs, f_high, side='right')
+    indices, values = envelope_decimate(psd, lo, hi, max_points)
+    return np.asarray(freqs)[indices], values
+
+
+def area_polygon(x, y):
+    """Контур области между кривой y(x) и нулем (как fill_between) для обновления Polygon на месте"""
+    x = np.asarray(x, dtype=float)
+    return np.column_stack((np.concatenate(([x[0]], x, [x[-1]])),
+                            np.concatenate(([0.0], np.asarray(y, dtype=float), [0.0]))))
+
+
+def envelope_polygon(positions, values, min_height=0.0):
+    """Контур полосы min/max огибающей (пары точек по корзинам) для заливки без обводки
+
+    Заливка многоугольника рисуется Agg в разы быстрее, чем ломаная, мечущаяся между минимумом
+    и максимумом; min_height не дает полосе стать тоньше пикселя. Возвращает вершины (N × 2).
+    """
+    n = len(values) // 2 * 2
+    x = (positions[0:n:2] + positions[1:n:2]) / 2
+    low = np.minimum(values[0:n:2], values[1:n:2])
+    high = np.maximum(values[0:n:2], values[1:n:2])
+    pad = np.maximum(0.0, min_height - (high - low)) / 2
+    low, high = low - pad, high + pad
+    return np.column_stack((np.concatenate((x, x[::-1])), np.concatenate((high, low[::-1]))))
+
+
+def _grouped_extrema(low, high, start, stop, n_buckets):
+    """Минимумы low и максимумы high групп строк [start, stop) сразу для всех столбцов
+
+    Возвращает (середины групп в номерах строк, минимумы, максимумы) - массивы (группы × каналы).
+    """
+    n = stop - start
+    group = -(-n // n_buckets)
+    n_full = n // group
+    end = start + n_full * group
+    lows = np.asarray(low[start:end], dtype=float).reshape(n_full, group, -1).min(axis=1)
+    highs = np.asarray(high[start:end], dtype=float).reshape(n_full, group, -1).max(axis=1)
+    centers = start + (np.arange(n_full) + 0.5) * group
+    if end < stop:
+        lows = np.vstack((lows, np.min(low[end:stop], axis=0)))
+        highs = np.vstack((highs, np.max(high[end:stop], axis=0)))
+        centers = np.append(centers, (end + stop) / 2)
+    return centers, lows, highs
+
+
+def block_envelope(data, start, stop, n_buckets):
+    """Min/max огибающая участка сразу по всем каналам записи (отсчеты × каналы) за один векторный проход
+
+    Возвращает (середины корзин в отсчетах, минимумы, максимумы). Если отсчетов не больше корзин,
+    возвращаются сами отсчеты, и минимумы - это тот же массив, что и максимумы.
+    """
+    start = max(0, int(start))
+    stop = min(len(data), int(stop))
+    if stop - start <= n_buckets:
+        block = np.asarray(data[start:stop], dtype=float)
+        return np.arange(start, stop, dtype=float), block, block
+    return _grouped_extrema(data, data, start, stop, n_buckets)
+
+
+def montage_polygons(positions, low, high, min_height=0.0):
+    """Контуры полос огибающей для всех каналов сразу: массив (каналы × вершины × 2) для PolyCollection"""
+    pad = np.maximum(0.0, min_height - (high - low)) / 2
+    low, high = low - pad, high + pad
+    x = np.concatenate((positions, positions[::-1]))
+    y = np.concatenate((high, low[::-1]), axis=0).T
+    return np.stack((np.broadcast_to(x, y.shape), y), axis=2)
+
+
+class MinMaxPyramid:
+    """Многоуровневая сводка записи: min/max по блокам 2^k отсчетов для первых n_channels каналов (float32)
+
+    Строится один раз (обычно в фоновом потоке); после этого огибающая любого участка
+    читается с уровня, соответствующего числу отсчетов на пиксель, - O(ширины экрана).
+    Окна короче 2^first_level отсчетов на точку читаются из сырых данных: это дешево, а мелкие
+    уровни занимали бы основную часть памяти сводки.
+    """
+
+    def __init__(self, data, n_channels=None, first_level=7, min_length=1024):
+        self.data = data
+        self.n_channels = data.shape[1] if n_channels is None else min(n_channels, data.shape[1])
+        self.first_level = first_level
+        self.min_length = min_length
+        self.levels = []  # [(k, min, max)], массивы (блоки × каналы)
+        self.ready = False
+
+    def build(self, block_size=1 << 20):
+        """Проход по записи блоками (подходит для memmap), затем попарное свертывание уровней"""
+        factor = 1 << self.first_level
+        n_blocks = len(self.data) // factor
+        shape = (n_blocks, self.n_channels)
+        mins = np.empty(shape, dtype=np.float32)
+        maxs = np.empty(shape, dtype=np.float32)
+        step = max(1, block_size // factor)
+        for b0 in range(0, n_blocks, step):
+            b1 = min(n_blocks, b0 + step)
+            chunk = np.asarray(self.data[b0 * factor:b1 * factor, :self.n_channels], dtype=float)
+            chunk = chunk.reshape(b1 - b0, factor, -1)
+            mins[b0:b1] = chunk.min(axis=1)
+            maxs[b0:b1] = chunk.max(axis=1)
+        levels = [(self.first_level, mins, maxs)]
+
+        while len(levels[-1][1]) >= 2 * self.min_length:
+            k, mins, maxs = levels[-1]
+            n = len(mins) // 2 * 2
+            levels.append((k + 1,
+                           np.minimum(mins[0:n:2], mins[1:n:2]),
+                           np.maximum(maxs[0:n:2], maxs[1:n:2])))
+
+        self.levels = levels
+        self.ready = True
+
+    def level_for(self, samples_per_point):
+        """Самый грубый уровень, блок которого не длиннее samples_per_point отсчетов (или None - сырые данные)"""
+        chosen = None
+        for level in self.levels:
+            if (1 << level[0]) <= samples_per_point:
+                chosen = level
+        return chosen
+
+    def envelope(self, channel, start, stop, max_points):
+        """Огибающая участка [start, stop) канала: (номера отсчетов, значения), не более ~max_points точек"""
+        start = max(0, int(start))
+        stop = min(len(self.data), int(stop))
+        ready = self.ready and channel < self.n_channels
+        level = self.level_for((stop - start) / max(1, max_points // 2)) if ready else None
+        if level is None:
+            return envelope_decimate(self.data[:, channel], start, stop, max_points)
+
+        k, mins, maxs = level
+        lo = start >> k
+        hi = min(len(mins), -(-stop // (1 << k)))
+        if hi - lo <= max_points // 2:
+            # Уровень уже достаточно грубый: по точке минимума и максимума на блок
+            rows = np.arange(lo, hi)
+            indices = np.stack((rows, rows), axis=1).ravel()
+            values = np.stack((mins[lo:hi, channel], maxs[lo:hi, channel]), axis=1).ravel().astype(float)
+        else:
+            indices, values = _bucket_envelope(mins[:, channel], maxs[:, channel], lo, hi, max_points // 2)
+        # Точка блока ставится в его середину
+        return (indices + 0.5) * (1 << k), values
+
+    def block_envelope(self, start, stop, n_buckets):
+        """Огибающая участка по всем каналам сразу (см. block_envelope) с подходящего уровня пирамиды"""
+        start = max(0, int(start))
+        stop = min(len(self.data), int(stop))
+        level = self.level_for((stop - start) / max(1, n_buckets)) if self.ready else None
+        if level is None:
+            return block_envelope(self.data[:, :self.n_channels], start, stop, n_buckets)
+        k, mins, maxs = level
+        lo = start >> k
+        hi = min(len(mins), -(-stop // (1 << k)))
+        centers, lows, highs = _grouped_extrema(mins, maxs, lo, hi, n_buckets)
+        return centers * (1 << k), lows, highs
+
+
+class WindowStats:
+    """Индекс для статистики любого окна канала за постоянное время
+
+    Накопленные суммы x и x² по блокам 2^block_level отсчетов (со сдвигом на среднее начала записи,
+    чтобы дисперсия не терялась на фоне постоянной составляющей) дают среднее и СКО; минимум и максимум
+    собираются из узлов пирамиды как в дереве отрезков. Неполные блоки на краях окна читаются из сырых данных.
+    """
+
+    def __init__(self, data, pyramid, block_level=8):
+        self.data = data
+        self.pyramid = pyramid
+        self.block_level = block_level
+        self.offset = None  # Сдвиг по каналам
+        self.sums = None  # Накопленные суммы (x - сдвиг) по блокам, (блоки + 1) × каналы
+        self.squares = None  # То же для (x - сдвиг)²
+        self.totals = {}  # канал -> статистика всей записи (заполняется при построении)
+        self.ready = False
+
+    def build(self, block_size=1 << 20):
+        factor = 1 << self.block_level
+        n_blocks = len(self.data) // factor
+        n_channels = self.data.shape[1]
+        self.offset = np.asarray(self.data[:block_size], dtype=float).mean(axis=0)
+        sums = np.zeros((n_blocks + 1, n_channels))
+        squares = np.zeros((n_blocks + 1, n_channels))
+        low = np.full(n_channels, np.inf)
+        high = np.full(n_channels, -np.inf)
+        step = max(1, block_size // factor)
+        for b0 in range(0, n_blocks, step):
+            b1 = min(n_blocks, b0 + step)
+            chunk = np.asarray(self.data[b0 * factor:b1 * factor], dtype=float) - self.offset
+            low = np.minimum(low, chunk.min(axis=0))
+            high = np.maximum(high, chunk.max(axis=0))
+            chunk = chunk.reshape(b1 - b0, factor, n_channels)
+            sums[b0 + 1:b1 + 1] = chunk.sum(axis=1)
+            squares[b0 + 1:b1 + 1] = np.einsum('ijk,ijk->ik', chunk, chunk)
+        np.cumsum(sums, axis=0, out=sums)
+        np.cumsum(squares, axis=0, out=squares)
+
+        # Статистика всей записи в том же проходе (с хвостом короче блока), чтобы не читать запись в потоке Tk
+        tail = np.asarray(self.data[n_blocks * factor:], dtype=float) - self.offset
+        n = len(self.data)
+        mean = (sums[-1] + tail.sum(axis=0)) / n
+        variance = np.maximum(0.0, (squares[-1] + np.einsum('ij,ij->j', tail, tail)) / n - mean * mean)
+        if len(tail):
+            low = np.minimum(low, tail.min(axis=0))
+            high = np.maximum(high, tail.max(axis=0))
+        self.totals = {i: (float(low[i] + self.offset[i]), float(high[i] + self.offset[i]),
+                           float(mean[i] + self.offset[i]), float(np.sqrt(variance[i])))
+                       for i in range(n_channels)}
+        self.sums, self.squares = sums, squares
+        self.ready = True
+
+    def extrema(self, channel, start, stop):
+        """Минимум и максимум участка: O(log) узлов пирамиды и меньше блока сырых отсчетов с каждого края"""
+        pyramid = self.pyramid
+        if pyramid is None or not pyramid.ready or channel >= pyramid.n_channels:
+            segment = np.asarray(self.data[start:stop, channel])
+            return float(segment.min()), float(segment.max())
+
+        factor = 1 << pyramid.first_level
+        lo = -(-start // factor)
+        hi = min(stop // factor, len(pyramid.levels[0][1]))
+        if hi <= lo:
+            segment = np.asarray(self.data[start:stop, channel])
+            return float(segment.min()), float(segment.max())
+
+        low, high = [], []
+        edges = [self.data[start:lo * factor, channel], self.data[hi * factor:stop, channel]]
+        for segment in edges:
+            if len(segment):
+                low.append(np.min(segment))
+                high.append(np.max(segment))
+
+        last = len(pyramid.levels) - 1
+        for i, (_, mins, maxs) in enumerate(pyramid.levels):
+            if i == last:
+                if hi > lo:
+                    low.append(mins[lo:hi, channel].min())
+                    high.append(maxs[lo:hi, channel].max())
+                break
+            # Непарные узлы на краях берутся с этого уровня, остальное - с уровня выше
+            if lo & 1:
+                low.append(mins[lo, channel])
+                high.append(maxs[lo, channel])
+                lo += 1
+            if hi & 1 and hi > lo:
+                hi -= 1
+                low.append(mins[hi, channel])
+                high.append(maxs[hi, channel])
+            if hi <= lo:
+                break
+            lo, hi = lo // 2, hi // 2
+        return float(min(low)), float(max(high))
+
+    def moments(self, channel, start, stop):
+        """Среднее и СКО участка по разности накопленных сумм"""
+        n = stop - start
+        factor = 1 << self.block_level
+        lo = -(-start // factor)
+        hi = stop // factor
+        if not self.ready or hi <= lo:
+            segment = np.asarray(self.data[start:stop, channel], dtype=float)
+            return float(segment.mean()), float(segment.std())
+
+        offset = self.offset[channel]
+        total = self.sums[hi, channel] - self.sums[lo, channel]
+        total_sq = self.squares[hi, channel] - self.squares[lo, channel]
+        for segment in (self.data[start:lo * factor, channel], self.data[hi * factor:stop, channel]):
+            segment = np.asarray(segment, dtype=float) - offset
+            total += segment.sum()
+            total_sq += np.dot(segment, segment)
+        mean = total / n
+        variance = max(0.0, total_sq / n - mean * mean)
+        return float(mean + offset), float(np.sqrt(variance))
+
+    def window(self, channel, start, stop):
+        """(минимум, максимум, среднее, СКО) участка [start, stop) канала"""
+        start = max(0, int(start))
+        stop = min(len(self.data), int(stop))
+        if stop <= start:
+            return (np.nan,) * 4
+        return self.extrema(channel, start, stop) + self.moments(channel, start, stop)
+
+    def whole(self, channel):
+        """Статистика всей записи канала или None, пока индекс не построен"""
+        return self.totals[channel] if self.ready else None
+
+
+class WindowCache:
+    """Небольшой LRU-кэш данных окон просмотра с фоновой предвыборкой соседних окон
+
+    compute(key) считает данные окна. get() отдает готовые данные из памяти или считает их сразу;
+    prefetch() ставит ключи в очередь фонового потока, заменяя прежние, еще не посчитанные запросы.
+    """
+
+    def __init__(self, compute, capacity=16):
+        self.compute = compute
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.pending = []  # Ключи, ожидающие фоновой предвыборки
+        self.generation = 0  # Растет при очистке: результаты, начатые до нее, отбрасываются
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            generation = self.generation
+        value = self.compute(key)
+        self.store(key, value, generation)
+        return value
+
+    def store(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def prefetch(self, keys):
+        with self.lock:
+            self.pending = [key for key in keys if key not in self.entries]
+        self.wakeup.set()
+
+    def worker(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                if not self.pending:
+                    self.wakeup.clear()
+                    continue
+                key = self.pending.pop(0)
+                generation = self.generation
+            try:
+                value = self.compute(key)
+            except Exception as e:
+                print(f"Ошибка предвыборки окна {key}: {e}")
+                continue
+            self.store(key, value, generation)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.pending = []
+            self.generation += 1
+
+
+class FrameRing:
+    """Кольцо прореженных корзин записи для воспроизведения: min/max всех каналов по bucket отсчетов
+
+    Корзины выровнены по сетке записи, поэтому кадр - срез кольца, а при движении вперед
+    досчитываются только новые корзины, сразу на всю емкость кольца вперед.
+    fill(начало, конец, число корзин) -> (минимумы, максимумы) - массивы (корзины × каналы).
+    Размер кольца фиксирован: старые корзины перезаписываются.
+    """
+
+    def __init__(self, fill, n_samples, n_channels, bucket, capacity):
+        self.fill = fill
+        self.bucket = bucket
+        self.capacity = capacity
+        self.n_buckets = -(-n_samples // bucket)
+        self.lows = np.zeros((capacity, n_channels))
+        self.highs = np.zeros((capacity, n_channels)) if bucket > 1 else self.lows
+        self.first = 0  # Корзины [first, last) сейчас в кольце
+        self.last = 0
+        self.fills = 0
+
+    def ensure(self, first, last):
+        """Корзины [first, last) в кольце (last не дальше конца записи)"""
+        if first < self.first or first > self.last or last - first > self.capacity:
+            self.first = self.last = first
+        if last <= self.last:
+            return
+        stop = min(self.n_buckets, first + self.capacity)
+        lows, highs = self.fill(self.last * self.bucket, stop * self.bucket, stop - self.last)
+        slots = np.arange(self.last, self.last + len(lows)) % self.capacity
+        self.lows[slots] = lows
+        if self.highs is not self.lows:
+            self.highs[slots] = highs
+        if self.last + len(lows) < stop:
+            # Хвост записи короче корзины (или не попал в уровень пирамиды)
+            self.n_buckets = self.last + len(lows)
+        self.last += len(lows)
+        self.first = max(self.first, self.last - self.capacity)
+        self.fills += 1
+
+    def frame(self, start, stop):
+        """Корзины, покрывающие отсчеты [start, stop): (середины корзин в отсчетах, минимумы, максимумы)
+
+        Как в block_envelope, без прореживания минимумы - тот же массив, что и максимумы.
+        """
+        first = max(0, int(start) // self.bucket)
+        last = min(self.n_buckets, -(-int(stop) // self.bucket))
+        self.ensure(first, last)
+        last = min(last, self.last)
+        buckets = np.arange(first, last)
+        slots = buckets % self.capacity
+        if self.bucket == 1:
+            lows = self.lows[slots]
+            return buckets.astype(float), lows, lows
+        return (buckets + 0.5) * self.bucket, self.lows[slots], self.highs[slots]
+
+
+class PlaybackClock:
+    """Часы воспроизведения: кадр по root.after каждые frame_ms, положение - по реальному времени
+
+    Положение отсчитывается от момента запуска (perf_counter), поэтому медленный кадр не замедляет
+    воспроизведение: следующий кадр сразу показывает нужное место, а пропущенные кадры считаются.
+    on_frame(положение) рисует кадр; вернув False, останавливает часы.
+    """
+
+    def __init__(self, root, on_frame, frame_ms=16):
+        self.root = root
+        self.on_frame = on_frame
+        self.frame_ms = frame_ms
+        self.pending = None
+        self.running = False
+        self.speed = 1.0
+        self.origin = 0.0  # Положение в момент started
+        self.started = 0.0
+        self.slot = -1  # Номер последнего показанного кадра от started
+        self.frames = 0
+        self.dropped = 0
+
+    def start(self, position, speed):
+        self.speed = speed
+        self.frames = 0
+        self.dropped = 0
+        self.running = True
+        self.seek(position)
+        self.pending = self.root.after(1, self.tick)
+
+    def seek(self, position):
+        """Новая точка отсчета: положение position в текущий момент"""
+        self.origin = position
+        self.started = time.perf_counter()
+        self.slot = -1
+
+    def set_speed(self, speed):
+        if self.running:
+            self.seek(self.position())
+        self.speed = speed
+
+    def position(self):
+        return self.origin + (time.perf_counter() - self.started) * self.speed
+
+    def tick(self):
+        self.pending = None
+        if not self.running:
+            return
+        elapsed = time.perf_counter() - self.started
+        slot = int(elapsed * 1000 // self.frame_ms)
+        if slot > self.slot:
+            self.dropped += slot - self.slot - 1
+            self.slot = slot
+            self.frames += 1
+            if self.on_frame(self.origin + elapsed * self.speed) is False:
+                self.stop()
+                return
+        # Следующий кадр - к началу следующего интервала, с поправкой на время отрисовки
+        wait_ms = (self.slot + 1) * self.frame_ms - (time.perf_counter() - self.started) * 1000
+        self.pending = self.root.after(max(1, int(wait_ms) + 1), self.tick)
+
+    def stop(self):
+        self.running = False
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+            self.pending = None
+
+    def stats_text(self):
+        return f"×{self.speed:g}, кадров {self.frames}, пропущено {self.dropped}"
+
+
+class BlitManager:
+    """Перерисовка только изменяемых (animated) художников поверх сохраненного фона фигуры
+
+    Фон снимается после каждой полной отрисовки холста (draw_event), поэтому изменение
+    размеров окна или осей достаточно обработать обычным canvas.draw().
+    """
+
+    def __init__(self, canvas, artists=()):
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        for artist in artists:
+            self.add_artist(artist)
+        self.draw_cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+    def add_artist(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+
+    def on_draw(self, event):
+        """Новый фон после полной перерисовки; изменяемые художники рисуются поверх"""
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def update(self):
+        """Быстрое обновление: фон + изменяемые художники, без пересчета осей и подписей"""
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        # Копируются на экран только области осей с изменяемыми художниками
+        for ax in {id(artist.axes): artist.axes for artist in self.artists}.values():
+            self.canvas.blit(ax.bbox)
+        self.canvas.flush_events()
+
+    def set_animated(self, animated):
+        """Анимированные художники не попадают в savefig; на время сохранения режим отключается"""
+        for artist in self.artists:
+            artist.set_animated(animated)
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self.draw_cid)
+
+
+class RedrawScheduler:
+    """Объединение запросов перерисовки: не больше одной отрисовки за кадр и всегда для последнего состояния
+
+    Навигация только меняет состояние вида и вызывает request(); сама отрисовка выполняется
+    из цикла Tk через root.after. Время каждой отрисовки измеряется для отладочной подписи.
+    """
+
+    def __init__(self, root, render, frame_ms=16):
+        self.root = root
+        self.render = render
+        self.frame_ms = frame_ms
+        self.pending = None  # Идентификатор запланированного root.after
+        self.last_start = 0.0
+        self.frame_time_ms = 0.0  # Длительность последней отрисовки
+        self.average_frame_ms = 0.0  # Скользящее среднее длительности
+        self.frames = 0
+        self.coalesced = 0  # Запросов, поглощенных уже запланированной отрисовкой
+
+    def request(self):
+        if self.pending is not None:
+            self.coalesced += 1
+            return
+        # Следующая отрисовка не раньше, чем через кадр после начала предыдущей
+        wait_ms = self.frame_ms - (time.perf_counter() - self.last_start) * 1000
+        self.pending = self.root.after(max(1, int(wait_ms)), self.run)
+
+    def run(self):
+        self.pending = None
+        self.last_start = time.perf_counter()
+        try:
+            self.render()
+        finally:
+            self.frame_time_ms = (time.perf_counter() - self.last_start) * 1000
+            self.average_frame_ms = (self.frame_time_ms if self.frames == 0
+                                     else 0.9 * self.average_frame_ms + 0.1 * self.frame_time_ms)
+            self.frames += 1
+
+    def cancel(self):
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+            self.pending = None
+
+    def stats_text(self):
+        return (f"кадр {self.frame_time_ms:.1f} мс (среднее {self.average_frame_ms:.1f}), "
+                f"кадров {self.frames}, объединено запросов {self.coalesced}")
+
+
+def axes_pixel_width(ax):
+    """Ширина области графика в пикселях экрана"""
+    return max(1, int(ax.get_window_extent().width))
+
+
+def nice_ticks(low, high, target=8):
+    """Круглые значения делений (шаг 1, 2 или 5 × 10^n) в диапазоне [low, high], около target штук"""
+    span = high - low
+    if not np.isfinite(span) or span <= 0:
+        return np.array([low])
+    raw = span / max(1, target)
+    magnitude = 10 ** np.floor(np.log10(raw))
+    step = magnitude * next(m for m in (1, 2, 5, 10) if m * magnitude >= raw)
+    first = np.ceil(low / step) * step
+    return np.arange(first, high + step * 1e-9, step)
+
+
+def _tick_label(value, step):
+    decimals = max(0, -int(np.floor(np.log10(step)))) if step < 1 else 0
+    return f"{value:.{decimals}f}"
+
+
+class TraceCanvas:
+    """Легкая отрисовка просмотра ЭЭГ прямо на tk.Canvas, без matplotlib
+
+    Элементы холста (ломаные сигналов, сетка, подписи, мини-карта) создаются один раз; при прокрутке
+    меняются только их координаты и тексты. Данные приходят уже прореженными до ~2 точек на пиксель.
+    """
+
+    margin_left = 70
+    margin_right = 20
+    margin_bottom = 40
+    title_height = 30
+    minimap_height = 36
+
+    def __init__(self, master, on_resize=None, on_select=None, min_select_pixels=5):
+        self.canvas = tk.Canvas(master, bg='white', highlightthickness=0)
+        self.on_resize = on_resize
+        self.on_select = on_select  # on_select(x0, x1) - выделение мышью в единицах оси X
+        self.min_select_pixels = min_select_pixels
+        self.xlim = (0.0, 1.0)
+        self.drag_start = None
+        self.width = 1
+        self.height = 1
+        self.mm = 1.0  # Пикселей на миллиметр экрана
+        self.ylim = None  # Текущий масштаб по Y (None - еще не рисовался)
+        self.minimap_source = None  # Данные, по которым построена ломаная мини-карты
+
+        c = self.canvas
+        self.title = c.create_text(0, 0, text='', font=("Arial", 12, "bold"), anchor='n')
+        self.minimap_span = c.create_rectangle(0, 0, 0, 0, fill='#FFCDD2', outline='')
+        self.minimap_line = c.create_line(0, 0, 0, 0, fill='gray', width=1)
+        self.minimap_frame = c.create_rectangle(0, 0, 0, 0, outline='#BDBDBD')
+        self.plot_frame = c.create_rectangle(0, 0, 0, 0, outline='#757575')
+        # Сохраненный участок и участок, выделяемый прямо сейчас
+        self.selection = c.create_rectangle(0, 0, 0, 0, fill='#FFE082', outline='', state='hidden')
+        self.drag_rect = c.create_rectangle(0, 0, 0, 0, fill='#FFC107', stipple='gray25', outline='', state='hidden')
+        c.tag_lower(self.selection, self.plot_frame)
+        self.x_label = c.create_text(0, 0, text='Время от начала окна (секунды)', font=("Arial", 10), anchor='s')
+        self.y_label = c.create_text(0, 0, text='Амплитуда (мкВ)', font=("Arial", 10), angle=90, anchor='n')
+        self.window_text = c.create_text(0, 0, text='', font=("Arial", 10), anchor='nw')
+        self.stats_text = c.create_text(0, 0, text='', font=("Courier", 8), fill='#757575', anchor='sw')
+        self.traces = []  # Ломаные сигналов (создаются по мере надобности, лишние скрываются)
+        self.x_ticks = []  # (линия сетки, подпись)
+        self.y_ticks = []
+        c.bind('<Configure>', self.on_configure)
+        c.bind('<ButtonPress-1>', self.on_press)
+        c.bind('<B1-Motion>', self.on_drag)
+        c.bind('<ButtonRelease-1>', self.on_release)
+
+    def on_configure(self, event):
+        self.width, self.height = max(1, event.width), max(1, event.height)
+        self.mm = self.canvas.winfo_fpixels('1m')
+        self.minimap_source = None
+        if self.on_resize is not None:
+            self.on_resize()
+
+    def x_from_pixel(self, px):
+        left, _, right, _ = self.plot_box()
+        px = min(max(px, left), right)
+        return self.xlim[0] + (px - left) * (self.xlim[1] - self.xlim[0]) / (right - left)
+
+    def on_press(self, event):
+        left, top, right, bottom = self.plot_box()
+        self.drag_start = event.x if left <= event.x <= right and top <= event.y <= bottom else None
+
+    def on_drag(self, event):
+        if self.drag_start is None:
+            return
+        _, top, _, bottom = self.plot_box()
+        self.canvas.coords(self.drag_rect, self.drag_start, top, event.x, bottom)
+        self.canvas.itemconfigure(self.drag_rect, state='normal')
+
+    def on_release(self, event):
+        self.canvas.itemconfigure(self.drag_rect, state='hidden')
+        if self.drag_start is None:
+            return
+        start, self.drag_start = self.drag_start, None
+        if abs(event.x - start) >= self.min_select_pixels and self.on_select is not None:
+            x0, x1 = sorted((self.x_from_pixel(start), self.x_from_pixel(event.x)))
+            self.on_select(x0, x1)
+
+    def plot_box(self):
+        """Область графика в пикселях холста: (левый, верхний, правый, нижний)"""
+        top = self.title_height + self.minimap_height + 10
+        return (self.margin_left, top, max(self.margin_left + 1, self.width - self.margin_right),
+                max(top + 1, self.height - self.margin_bottom))
+
+    def plot_width(self):
+        left, _, right, _ = self.plot_box()
+        return right - left
+
+    def plot_height(self):
+        _, top, _, bottom = self.plot_box()
+        return bottom - top
+
+    def plot_height_mm(self):
+        return self.plot_height() / self.mm
+
+    @staticmethod
+    def to_pixels(x, y, xlim, ylim, box):
+        """Плоский список координат [x0, y0, x1, y1, ...] для canvas.coords"""
+        left, top, right, bottom = box
+        px = left + (np.asarray(x, dtype=float) - xlim[0]) * ((right - left) / (xlim[1] - xlim[0]))
+        py = bottom - (np.asarray(y, dtype=float) - ylim[0]) * ((bottom - top) / (ylim[1] - ylim[0]))
+        return np.column_stack((px, py)).ravel().tolist()
+
+    def set_line(self, item, coords):
+        if len(coords) < 4:
+            self.canvas.itemconfigure(item, state='hidden')
+        else:
+            self.canvas.coords(item, coords)
+            self.canvas.itemconfigure(item, state='normal')
+
+    def set_traces(self, traces, xlim, ylim, box):
+        """traces: [(x, y, цвет, толщина)]; элементы холста переиспользуются между кадрами"""
+        c = self.canvas
+        while len(self.traces) < len(traces):
+            self.traces.append(c.create_line(0, 0, 0, 0))
+        for item, (x, y, color, width) in zip(self.traces, traces):
+            self.set_line(item, self.to_pixels(x, y, xlim, ylim, box))
+            c.itemconfigure(item, fill=color, width=width)
+        for item in self.traces[len(traces):]:
+            c.itemconfigure(item, state='hidden')
+
+    def set_ticks(self, pool, values, labels, vertical, box):
+        """Линии сетки и подписи делений; создаются по мере надобности и лежат под сигналами"""
+        c = self.canvas
+        left, top, right, bottom = box
+        while len(pool) < len(values):
+            line = c.create_line(0, 0, 0, 0, fill='#E0E0E0')
+            label = c.create_text(0, 0, text='', font=("Arial", 8), anchor='n' if vertical else 'e')
+            c.tag_lower(line, self.plot_frame)
+            pool.append((line, label))
+        for (line, label), position, text in zip(pool, values, labels):
+            if vertical:
+                c.coords(line, position, top, position, bottom)
+                c.coords(label, position, bottom + 3)
+            else:
+                c.coords(line, left, position, right, position)
+                c.coords(label, left - 4, position)
+            c.itemconfigure(line, state='normal')
+            c.itemconfigure(label, text=text, state='normal')
+        for line, label in pool[len(values):]:
+            c.itemconfigure(line, state='hidden')
+            c.itemconfigure(label, state='hidden')
+
+    def draw(self, traces, xlim, ylim, title='', window_text='', stats_text='',
+             minimap=None, minimap_ylim=None, total_duration=None, span=None,
+             fixed_y_ticks=None, y_title='Амплитуда (мкВ)', selection=None):
+        """Обновляет весь кадр: сигналы, сетку, подписи, мини-карту и положение окна на ней
+
+        fixed_y_ticks - [(значение, подпись)] вместо круглых делений амплитуды (например, названия каналов монтажа);
+        selection - (x0, x1) выделенного участка в единицах оси X или None.
+        """
+        c = self.canvas
+        box = self.plot_box()
+        left, top, right, bottom = box
+        self.xlim = xlim
+        self.ylim = ylim
+
+        c.coords(self.plot_frame, left, top, right, bottom)
+        c.coords(self.title, (left + right) / 2, 4)
+        c.itemconfigure(self.title, text=title)
+        c.coords(self.x_label, (left + right) / 2, self.height - 2)
+        c.coords(self.y_label, 4, (top + bottom) / 2)
+        c.itemconfigure(self.y_label, text=y_title)
+        c.coords(self.window_text, left + 6, top + 4)
+        c.itemconfigure(self.window_text, text=window_text)
+        c.coords(self.stats_text, left + 6, bottom - 4)
+        c.itemconfigure(self.stats_text, text=stats_text, state='normal' if stats_text else 'hidden')
+
+        x_values = nice_ticks(xlim[0], xlim[1], max(2, (right - left) // 100))
+        x_step = x_values[1] - x_values[0] if len(x_values) > 1 else 1.0
+        x_pixels = left + (x_values - xlim[0]) * ((right - left) / (xlim[1] - xlim[0]))
+        self.set_ticks(self.x_ticks, x_pixels, [_tick_label(v, x_step) for v in x_values], True, box)
+        if fixed_y_ticks is None:
+            y_values = nice_ticks(ylim[0], ylim[1], max(2, (bottom - top) // 50))
+            y_step = y_values[1] - y_values[0] if len(y_values) > 1 else 1.0
+            y_texts = [_tick_label(v, y_step) for v in y_values]
+        else:
+            y_values = np.array([value for value, _ in fixed_y_ticks], dtype=float)
+            y_texts = [text for _, text in fixed_y_ticks]
+        y_pixels = bottom - (y_values - ylim[0]) * ((bottom - top) / (ylim[1] - ylim[0]))
+        self.set_ticks(self.y_ticks, y_pixels, y_texts, False, box)
+
+        self.set_traces(traces, xlim, ylim, box)
+
+        if selection is not None and selection[1] > xlim[0] and selection[0] < xlim[1]:
+            x0, x1 = self.to_pixels(np.clip(selection, *xlim), (0, 0), xlim, ylim, box)[0::2]
+            c.coords(self.selection, x0, top, max(x1, x0 + 1), bottom)
+            c.itemconfigure(self.selection, state='normal')
+        else:
+            c.itemconfigure(self.selection, state='hidden')
+
+        # Мини-карта: ломаная пересчитывается только при смене данных или размеров холста
+        map_box = (left, self.title_height, right, self.title_height + self.minimap_height)
+        c.coords(self.minimap_frame, *map_box)
+        if minimap is not None and total_duration:
+            if self.minimap_source is not minimap:
+                self.minimap_source = minimap
+                self.set_line(self.minimap_line, self.to_pixels(minimap[0], minimap[1], (0, total_duration),
+                                                                minimap_ylim, map_box))
+            if span is not None:
+                x0, x1 = self.to_pixels(span, (0, 0), (0, total_duration), (0, 1), map_box)[0::2]
+                c.coords(self.minimap_span, x0, map_box[1], max(x1, x0 + 2), map_box[3])
@@ -2,9 +2,21 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.patches import Polygon, Rectangle
+from matplotlib.ticker import AutoLocator, ScalarFormatter
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.widgets import SpanSelector
 import os
+import threading
+import time
+
+from eeg_dsp import (PolyphaseDecimator, band_average_csd, band_limited_waveform, channel_spectra, coherence_from_csd, compute_band_power,
+                     compute_psd, default_cache_dir, design_filter_sos, detect_artifacts, filter_recording, load_asc_recording, next_fast_len, plan_fft_length,
+                     segment_mask_from_epochs, SegmentSpectra, SosFilter, SpectrumIntegral)
+from eeg_pool import AnalysisPool, BackgroundJob
+from eeg_render import (BlitManager, FrameRing, MinMaxPyramid, PlaybackClock, RedrawScheduler, TraceCanvas, WindowCache, WindowStats, block_envelope,
+                        montage_polygons, axes_pixel_width, envelope_decimate, area_polygon, envelope_polygon, spectrum_for_display)
 
 
 class EEGAnalyzerApp:
@@ -20,6 +32,59 @@ class EEGAnalyzerApp:
         self.fs = 5000  # Частота дискретизации
         self.eeg_display_seconds = 10  # Секунд для отображения ЭЭГ
         self.eeg_start_time = 0  # Начальное время для отображения ЭЭГ
+        self.show_delta_wave = False  # Наложение реальной дельта-волны на сигнал
+        self.delta_wave_cache = {}  # Канал -> (дельта-волна, частота отсчетов волны) или None при ошибке
+        self.delta_wave_job = None  # Фоновое вычисление дельта-волны
+        self.delta_wave_key = None  # (канал, полоса дельты) вычисляемой волны
+        self.points_per_pixel = 2  # Точек min/max огибающей на пиксель ширины графика
+        self.draft_points_per_pixel = 0.5  # То же в черновом качестве (во время быстрой навигации)
+        self.draft_quality = False  # Черновые кадры: грубый уровень пирамиды, без сглаживания
+        self.interaction_idle_ms = 200  # Пауза ввода, после которой кадр уточняется до полного качества
+        self.last_interaction = 0.0  # Время последнего действия навигации (perf_counter)
+        self.refine_pending = None  # Запланированное уточнение кадра
+        self.minimap_cache = {}  # (канал, число точек) -> огибающая всей записи для мини-карты
+        self.saved_analysis_text = None  # (заголовок, текст) результатов анализа на время просмотра ЭЭГ
+        self.eeg_blit = None  # Быстрая перерисовка художников просмотра ЭЭГ
+        self.eeg_redraw = RedrawScheduler(self.root, self.update_eeg_display)  # Объединение запросов перерисовки
+        self.show_frame_stats = False  # Отладочная подпись со временем кадра
+        self.fast_trace = False  # Просмотр ЭЭГ прямо на tk.Canvas вместо matplotlib (быстрая прокрутка)
+        self.montage = False  # Все каналы друг под другом на одной оси времени
+        self.montage_sensitivity = 10  # Чувствительность монтажа, мкВ/мм
+        self.window_cache = WindowCache(self.compute_window)  # Огибающие и статистика окон (с предвыборкой соседних)
+        self.eeg_scroll_direction = 1  # Направление последней прокрутки: 1 - вперед, -1 - назад
+        self.eeg_plot_width = 1  # Ширина графика ЭЭГ в пикселях при последней отрисовке
+        self.playback = PlaybackClock(self.root, self.playback_frame)  # Непрерывное воспроизведение ЭЭГ
+        self.playback_speed = 1  # Скорость воспроизведения относительно реального времени
+        self.playback_ring = None  # Кольцо прореженных корзин записи для кадров воспроизведения
+        self.segment_spectra_cache = {}  # (частота, фильтр, сегмент, артефакты) -> периодограммы сегментов Уэлча
+        self.region = None  # (начало, конец) выделенного на ЭЭГ участка, сек
+        self.region_result = None  # СПМ и мощности ритмов выделенного участка
+        self.limit_to_region = False  # Анализ спектра только по выделенному участку
+        self.epoch_table_seconds = 30  # Длина эпохи в таблице мощностей по времени
+        self.epoch_table_rows = 120  # Наибольшее число строк таблицы (эпохи укрупняются)
+        self.spectrum_panels = None  # Постоянные художники сетки анализа (столбцы, кривые, заливки)
+        self.layout_pad = 3.0  # Отступ tight_layout текущей сетки (пересчет только при изменении размеров)
+        self.eeg_layout = None  # Состояние осей ЭЭГ, при изменении которого нужна полная перерисовка
+        self.pyramid = None  # Многоуровневая min/max сводка записи (строится в фоне при загрузке)
+        self.window_stats = None  # Индекс статистики окон (накопленные суммы, строится вместе с пирамидой)
+        self.analysis_fs = 250  # Частота дискретизации для спектрального анализа (после децимации)
+        self.decimated_cache = {}  # Децимированные копии текущей записи по частоте
+        self.filter_mode = (0.3, None, 50.0)  # (ФВЧ, ФНЧ, режекция) в Гц перед анализом или None
+        self.filtered_cache = {}  # Отфильтрованные копии по (частота, фильтр)
+        self.recording_cache_dir = default_cache_dir()  # Каталог бинарного кэша загруженных записей
+        self.recording_cache_bytes = 64 << 30  # Предел размера кэша записей (старые файлы удаляются)
+        self.pool = None  # Пул процессов для поканального анализа
+        self.analysis_batch = None  # Выполняющийся анализ
+        self.psd_method = 'periodogram'  # 'periodogram' или 'welch'
+        self.welch_segment_seconds = 4  # Длина сегмента Уэлча (перекрытие 50%)
+        self.fft_mode = 'pad'  # Быстрая длина БПФ: 'pad' - дополнение нулями, 'trim' - усечение записи
+        self.reject_artifacts = False  # Исключать эпохи с артефактами из оценок Уэлча
+        self.artifact_epoch_seconds = 2.0  # Длина эпохи для поиска артефактов
+        self.artifact_cache = None  # (маска плохих эпох, метрики эпох) текущей записи
+        self.coherence_pairs = [('P3', 'P4'), ('O1', 'O2'), ('Pz', 'Oz')]  # Пары для когерентности
+        self.csd_cache = {}  # Матрицы взаимных спектров по (частота, фильтр, сегмент, исключение артефактов)
+        self.zoom_oversample = 4  # Во сколько раз сетка zoom-спектра дельта-ритма мельче шага БПФ записи
+        self.band_max_freq = 50.0  # Наибольшая граница ритма: спектры анализа покрывают 0-50 Гц
 
         # Обновленные диапазоны частот согласно стандартам
         self.freq_bands = {
@@ -29,8 +94,15 @@ class EEGAnalyzerApp:
             'beta': (15.0, 30.0),
             'gamma': (30.0, 45.0)
         }
+        self.default_freq_bands = dict(self.freq_bands)
+        self.band_symbols = {'delta': 'Δ', 'theta': 'θ', 'alpha': 'α', 'beta': 'β', 'gamma': 'γ'}
+        self.shown_analysis = None  # (метод, аргументы) показанного анализа: повтор по готовым спектрам
+        self.band_integrals = None  # (спектры, накопленные интегралы по каналам) последнего анализа
+        self.bands_stale = False  # Диапазоны менялись, пока был открыт просмотр ЭЭГ
 
         self.create_widgets()
+        self.start_analysis_pool()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         # Заголовок
@@ -97,6 +169,18 @@ class EEGAnalyzerApp:
                                           state="disabled")
         self.analyze_full_btn.pack(side=tk.LEFT, padx=5)
 
+        # Кнопка когерентности
+        self.coherence_btn = tk.Button(button_row2, text="КОГЕРЕНТНОСТЬ",
+                                       command=self.analyze_coherence,
+                                       font=("Arial", 11, "bold"),
+                                       width=18,
+                                       height=2,
+                                       bg="#009688",
+                                       fg="white",
+                                       activebackground="#00796B",
+                                       state="disabled")
+        self.coherence_btn.pack(side=tk.LEFT, padx=5)
+
         # Кнопка сохранения результатов
         self.save_btn = tk.Button(button_row2, text="СОХРАНИТЬ РЕЗУЛЬТАТЫ",
                                   command=self.save_results,
@@ -119,6 +203,94 @@ class EEGAnalyzerApp:
                                   state="disabled")
         self.back_btn.pack(side=tk.LEFT, padx=5)
 
+        # Настройки спектрального анализа
+        settings_row = tk.Frame(button_frame)
+        settings_row.pack(pady=5)
+
+        tk.Label(settings_row, text="Частота анализа:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        self.analysis_fs_options = {
+            "5000 Гц (без децимации)": None,
+            "500 Гц": 500,
+            "250 Гц": 250
+        }
+        self.analysis_fs_combo = ttk.Combobox(settings_row, values=list(self.analysis_fs_options),
+                                              state="readonly", width=24)
+        self.analysis_fs_combo.set("250 Гц")
+        self.analysis_fs_combo.bind("<<ComboboxSelected>>", self.on_analysis_fs_changed)
+        self.analysis_fs_combo.pack(side=tk.LEFT, padx=5)
+
+        tk.Label(settings_row, text="Метод СПМ:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        self.psd_method_options = {
+            "Периодограмма": 'periodogram',
+            f"Уэлч ({self.welch_segment_seconds} сек)": 'welch'
+        }
+        self.psd_method_combo = ttk.Combobox(settings_row, values=list(self.psd_method_options),
+                                             state="readonly", width=18)
+        self.psd_method_combo.set("Периодограмма")
+        self.psd_method_combo.bind("<<ComboboxSelected>>", self.on_psd_method_changed)
+        self.psd_method_combo.pack(side=tk.LEFT, padx=5)
+
+        tk.Label(settings_row, text="Длина БПФ:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        self.fft_mode_options = {
+            "Дополнение нулями": 'pad',
+            "Усечение записи": 'trim'
+        }
+        self.fft_mode_combo = ttk.Combobox(settings_row, values=list(self.fft_mode_options),
+                                           state="readonly", width=18)
+        self.fft_mode_combo.set("Дополнение нулями")
+        self.fft_mode_combo.bind("<<ComboboxSelected>>", self.on_fft_mode_changed)
+        self.fft_mode_combo.pack(side=tk.LEFT, padx=5)
+
+        tk.Label(settings_row, text="Фильтр:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        self.filter_options = {
+            "Без фильтра": None,
+            "ФВЧ 0.3 Гц + режекция 50 Гц": (0.3, None, 50.0),
+            "Полоса 0.3-45 Гц + режекция 50 Гц": (0.3, 45.0, 50.0)
+        }
+        self.filter_combo = ttk.Combobox(settings_row, values=list(self.filter_options),
+                                         state="readonly", width=30)
+        self.filter_combo.set("ФВЧ 0.3 Гц + режекция 50 Гц")
+        self.filter_combo.bind("<<ComboboxSelected>>", self.on_filter_changed)
+        self.filter_combo.pack(side=tk.LEFT, padx=5)
+
+        self.reject_artifacts_var = tk.BooleanVar(value=self.reject_artifacts)
+        tk.Checkbutton(settings_row, text="Исключать артефакты", variable=self.reject_artifacts_var,
+                       command=self.on_reject_artifacts_changed,
+                       font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        self.limit_to_region_var = tk.BooleanVar(value=self.limit_to_region)
+        tk.Checkbutton(settings_row, text="Только выделенный участок", variable=self.limit_to_region_var,
+                       command=self.on_limit_to_region_changed,
+                       font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+
+        # Редактор диапазонов ритмов: результаты пересчитываются сразу по готовым спектрам
+        bands_row = tk.Frame(button_frame)
+        bands_row.pack(pady=5)
+
+        tk.Label(bands_row, text="Диапазоны ритмов (Гц):", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+        self.band_vars = {}
+        for band, (f_low, f_high) in self.freq_bands.items():
+            tk.Label(bands_row, text=f"{self.band_symbols[band]}:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=(8, 2))
+            band_fields = []
+            for value in (f_low, f_high):
+                var = tk.StringVar(value=f"{value:g}")
+                spinbox = tk.Spinbox(bands_row, from_=0.0, to=self.band_max_freq, increment=0.5, width=5, textvariable=var,
+                                     command=self.on_band_edited)
+                spinbox.bind("<Return>", self.on_band_edited)
+                spinbox.bind("<FocusOut>", self.on_band_edited)
+                spinbox.pack(side=tk.LEFT)
+                band_fields.append(var)
+                if len(band_fields) == 1:
+                    tk.Label(bands_row, text="-").pack(side=tk.LEFT)
+            self.band_vars[band] = band_fields
+
+        tk.Button(bands_row, text="По умолчанию", command=self.reset_freq_bands,
+                  font=("Arial", 9), bg="#F5F5F5", fg="black").pack(side=tk.LEFT, padx=10)
+
         # Фрейм управления просмотром ЭЭГ
         self.eeg_control_frame = tk.Frame(button_frame)
 
@@ -205,6 +377,67 @@ class EEGAnalyzerApp:
                                      state="disabled")
         self.zoom_in_btn.pack(side=tk.LEFT, padx=2)
 
+        # Удержание кнопок прокрутки повторяет команду; перерисовки при этом объединяются
+        for btn in (self.scroll_left_btn, self.scroll_right_btn):
+            btn.config(repeatdelay=300, repeatinterval=50)
+
+        self.show_delta_wave_var = tk.BooleanVar(value=self.show_delta_wave)
+        self.delta_wave_check = tk.Checkbutton(scroll_frame, text=f"Дельта-волна ({self.band_range('delta')} Гц)",
+                                               variable=self.show_delta_wave_var,
+                                               command=self.on_show_delta_wave_changed,
+                                               font=("Arial", 9, "bold"))
+        self.delta_wave_check.pack(side=tk.LEFT, padx=5)
+
+        self.show_frame_stats_var = tk.BooleanVar(value=self.show_frame_stats)
+        tk.Checkbutton(scroll_frame, text="Время кадра", variable=self.show_frame_stats_var,
+                       command=self.on_show_frame_stats_changed,
+                       font=("Arial", 9)).pack(side=tk.LEFT, padx=5)
+
+        self.fast_trace_var = tk.BooleanVar(value=self.fast_trace)
+        tk.Checkbutton(scroll_frame, text="Быстрая отрисовка", variable=self.fast_trace_var,
+                       command=self.on_fast_trace_changed,
+                       font=("Arial", 9)).pack(side=tk.LEFT, padx=5)
+
+        # Воспроизведение со скоростью бумажной ЭЭГ
+        playback_frame = tk.Frame(self.eeg_control_frame)
+        playback_frame.pack(pady=5)
+
+        self.play_btn = tk.Button(playback_frame, text="▶ ВОСПРОИЗВЕДЕНИЕ",
+                                  command=self.toggle_playback,
+                                  font=("Arial", 9, "bold"),
+                                  width=18,
+                                  height=1,
+                                  bg="#D1C4E9",
+                                  fg="black",
+                                  state="disabled")
+        self.play_btn.pack(side=tk.LEFT, padx=2)
+
+        tk.Label(playback_frame, text="Скорость:", font=("Arial", 9)).pack(side=tk.LEFT, padx=5)
+        self.playback_speed_combo = ttk.Combobox(playback_frame, values=[f"×{v}" for v in (1, 2, 3, 5, 10)],
+                                                 state="readonly", width=5)
+        self.playback_speed_combo.set(f"×{self.playback_speed}")
+        self.playback_speed_combo.bind("<<ComboboxSelected>>", self.on_playback_speed_changed)
+        self.playback_speed_combo.pack(side=tk.LEFT, padx=5)
+
+        # Монтаж всех каналов
+        montage_frame = tk.Frame(self.eeg_control_frame)
+        montage_frame.pack(pady=5)
+
+        self.montage_var = tk.BooleanVar(value=self.montage)
+        tk.Checkbutton(montage_frame, text="Все каналы (монтаж)", variable=self.montage_var,
+                       command=self.on_montage_changed,
+                       font=("Arial", 9, "bold")).pack(side=tk.LEFT, padx=5)
+
+        tk.Label(montage_frame, text="Чувствительность:", font=("Arial", 9)).pack(side=tk.LEFT, padx=5)
+        self.sensitivity_combo = ttk.Combobox(montage_frame, values=[f"{v} мкВ/мм" for v in (2, 5, 7, 10, 20, 50, 100)],
+                                              state="readonly", width=12)
+        self.sensitivity_combo.set(f"{self.montage_sensitivity} мкВ/мм")
+        self.sensitivity_combo.bind("<<ComboboxSelected>>", self.on_sensitivity_changed)
+        self.sensitivity_combo.pack(side=tk.LEFT, padx=5)
+
+        tk.Button(montage_frame, text="Сбросить участок", command=self.clear_region,
+                  font=("Arial", 9), bg="#FFF8E1", fg="black").pack(side=tk.LEFT, padx=10)
+
         # Информация о файле
         self.file_label = tk.Label(self.root, text="Файл не загружен",
                                    font=("Arial", 12))
@@ -221,16 +454,22 @@ class EEGAnalyzerApp:
         plot_frame = tk.Frame(self.root)
         plot_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        # Создаем фигуру matplotlib
+        # Две постоянные фигуры: анализ и просмотр ЭЭГ; при смене вида меняется только видимый холст
         self.fig = plt.figure(figsize=(15, 10))
-
-        # Изначально создаем сетку для анализа
         self.setup_analysis_grid()
-
         self.canvas = FigureCanvasTkAgg(self.fig, master=plot_frame)
+        self.canvas.mpl_connect('resize_event', self.on_figure_resize)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill='both', expand=True)
 
+        self.eeg_fig = plt.figure(figsize=(15, 10))
+        self.eeg_canvas = FigureCanvasTkAgg(self.eeg_fig, master=plot_frame)
+        self.eeg_canvas.mpl_connect('resize_event', self.on_eeg_figure_resize)
+        self.setup_eeg_grid()
+
+        # Быстрый просмотр ЭЭГ без matplotlib; графики анализа и сохранение остаются на фигурах
+        self.trace_canvas = TraceCanvas(plot_frame, on_resize=self.request_eeg_redraw, on_select=self.on_region_selected)
+
     def setup_analysis_grid(self):
         """Настраивает сетку для анализа спектра"""
         self.fig.clear()
@@ -243,19 +482,81 @@ class EEGAnalyzerApp:
             row = 1 + i // 3
             col = i % 3
             self.ax_psd.append(self.fig.add_subplot(self.gs[row, col]))
+        self.spectrum_panels = None
+
+        self.layout_pad = 3.0
+        self.fig.tight_layout(pad=self.layout_pad)
+
+    def on_figure_resize(self, event):
+        """Раскладка осей пересчитывается только при изменении размеров окна"""
+        self.fig.tight_layout(pad=self.layout_pad)
 
-        self.fig.tight_layout(pad=3.0)
+    def on_eeg_figure_resize(self, event):
+        """Раскладка фигуры ЭЭГ при изменении размеров окна"""
+        self.eeg_fig.tight_layout(pad=3.0)
 
     def setup_eeg_grid(self):
-        """Настраивает сетку для просмотра ЭЭГ"""
-        self.fig.clear()
+        """Настраивает сетку для просмотра ЭЭГ; художники создаются один раз и дальше только обновляются"""
         # Основной график ЭЭГ
-        self.ax_eeg = self.fig.add_subplot(111)
+        self.ax_eeg = self.eeg_fig.add_subplot(111)
+        self.ax_eeg.set_ylabel('Амплитуда (мкВ)', fontsize=12)
+        self.ax_eeg.set_xlabel('Время от начала окна (секунды)', fontsize=12)
+        self.ax_eeg.grid(True, alpha=0.3)
+        self.eeg_line, = self.ax_eeg.plot([], [], color='#2196F3', linewidth=1)
+        # Прореженный сигнал рисуется залитой полосой min/max огибающей
+        self.eeg_band = Polygon(np.zeros((1, 2)), closed=True, color='#2196F3', linewidth=0, visible=False)
+        self.ax_eeg.add_patch(self.eeg_band)
+        # Монтаж: все каналы - по одной ломаной или полосе огибающей в общих коллекциях
+        self.montage_lines = LineCollection([], colors='#2196F3', linewidths=0.8, visible=False)
+        self.montage_bands = PolyCollection([], facecolors='#2196F3', linewidths=0, visible=False)
+        self.ax_eeg.add_collection(self.montage_lines)
+        self.ax_eeg.add_collection(self.montage_bands)
+        self.delta_line, = self.ax_eeg.plot([], [], color='#FF5722', linewidth=2, label=f"Дельта {self.band_range('delta')} Гц")
+        self.delta_legend = self.ax_eeg.legend(handles=[self.delta_line], loc='upper right', fontsize=9)
+        self.eeg_title = self.ax_eeg.set_title('', fontweight='bold', fontsize=14)
+        self.eeg_window_text = self.ax_eeg.text(0.01, 0.98, '', transform=self.ax_eeg.transAxes,
+                                                fontsize=10, va='top')
+        self.frame_stats_text = self.ax_eeg.text(0.01, 0.02, '', transform=self.ax_eeg.transAxes,
+                                                 fontsize=8, color='#757575', family='monospace')
 
         # Мини-карта всего сигнала
-        self.ax_minimap = self.fig.add_axes([0.1, 0.92, 0.8, 0.06])  # [left, bottom, width, height]
-
-        self.fig.tight_layout(pad=3.0)
+        self.ax_minimap = self.eeg_fig.add_axes([0.1, 0.92, 0.8, 0.06])  # [left, bottom, width, height]
+        self.ax_minimap.set_ylabel('Вся запись', fontsize=8)
+        self.ax_minimap.tick_params(axis='both', which='major', labelsize=6)
+        self.ax_minimap.grid(True, alpha=0.2)
+        self.minimap_line, = self.ax_minimap.plot([], [], color='gray', linewidth=0.5, alpha=0.7)
+        # Текущее окно на мини-карте: по X в секундах, по Y на всю высоту осей
+        self.minimap_span = Rectangle((0, 0), 0, 1, transform=self.ax_minimap.get_xaxis_transform(),
+                                      alpha=0.3, color='red')
+        self.ax_minimap.add_patch(self.minimap_span)
+
+        # Выделенный участок (по X в секундах от начала окна) и его спектр во вставке
+        self.region_span = Rectangle((0, 0), 0, 1, transform=self.ax_eeg.get_xaxis_transform(),
+                                     alpha=0.25, color='#FFC107', visible=False)
+        self.ax_eeg.add_patch(self.region_span)
+        self.ax_region = self.ax_eeg.inset_axes([0.70, 0.60, 0.28, 0.36])
+        self.ax_region.set_facecolor((1, 1, 1, 0.85))
+        self.ax_region.tick_params(labelsize=7)
+        self.ax_region.grid(True, alpha=0.3)
+        self.region_line, = self.ax_region.plot([], [], color='#E65100', linewidth=1)
+        self.region_title = self.ax_region.set_title('', fontsize=8)
+        self.ax_region.set_visible(False)
+
+        self.eeg_fig.tight_layout(pad=3.0)
+
+        # Данные, окно на мини-карте и заголовок меняются при прокрутке - рисуются поверх фона
+        # (мини-карта меняется только со сменой канала и остается в фоне)
+        # Выделенный участок рисуется под сигналом, вставка со спектром участка - поверх него
+        self.eeg_blit = BlitManager(self.eeg_canvas, [self.region_span, self.eeg_line, self.eeg_band, self.delta_line,
+                                                  self.montage_lines, self.montage_bands,
+                                                  self.eeg_window_text, self.frame_stats_text,
+                                                  self.minimap_span, self.ax_region])
+        self.eeg_layout = None
+
+        # Выделение участка мышью: спектр и мощности ритмов участка без повторных БПФ.
+        # Без собственного блиттинга: с useblit каждая отрисовка холста выполнялась дважды, а выбранный участок и так рисует region_span
+        self.region_selector = SpanSelector(self.ax_eeg, self.on_region_selected, 'horizontal', useblit=False,
+                                            minspan=0.05, props=dict(alpha=0.25, facecolor='#FFC107'))
 
     def create_results_area(self):
         # Фрейм для результатов
@@ -286,29 +587,46 @@ class EEGAnalyzerApp:
 
         if file_path:
             try:
-                # Чтение файла с обработкой заголовка
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    lines = file.readlines()
-
-                # Пропускаем строки заголовка и читаем данные
-                data_lines = []
-                for line in lines:
-                    if not line.startswith(';') and line.strip():
-                        data_lines.append(line.strip())
-
-                # Преобразуем данные в числовой формат
-                data = []
-                for line in data_lines:
-                    if line.strip():
-                        row = [float(x) for x in line.split()]
-                        data.append(row)
-
-                self.data = np.array(data)
+                # Результаты анализа прошлой записи не нужны, а ее общая память будет освобождена
+                if self.analysis_batch is not None:
+                    self.analysis_batch.cancel()
+                    self.analysis_batch = None
+                if self.delta_wave_job is not None:
+                    self.delta_wave_job.cancel()
+                    self.delta_wave_job = None
+
+                # Чтение файла блоками в бинарный кэш, запись открывается через memmap
+                self.data = load_asc_recording(file_path, self.recording_cache_dir,
+                                               max_cache_bytes=self.recording_cache_bytes)
                 self.total_duration = len(self.data) / self.fs
+                self.decimated_cache = {}
+                self.filtered_cache = {}
+                self.csd_cache = {}
+                self.artifact_cache = None
+                self.delta_wave_cache = {}
+                self.minimap_cache = {}
+                self.stop_playback()
+                self.window_cache.clear()
+                self.playback_ring = None
+                self.segment_spectra_cache = {}
+                self.region = None
+                self.region_result = None
+                self.shown_analysis = None
+                self.band_integrals = None
+                self.bands_stale = False
+                self.eeg_start_time = 0
+                self.eeg_layout = None
+                self.saved_analysis_text = None
+
+                # Пирамида огибающих и индекс статистики строятся в фоне; до готовности все считается по сырым отсчетам
+                self.pyramid = MinMaxPyramid(self.data, self.display_channel_count())
+                self.window_stats = WindowStats(self.data, self.pyramid)
+                threading.Thread(target=self.build_indexes, args=(self.pyramid, self.window_stats), daemon=True).start()
 
                 self.file_label.config(text=f"Загружен: {os.path.basename(file_path)}")
                 self.analyze_delta_btn.config(state="normal")
                 self.analyze_full_btn.config(state="normal")
+                self.coherence_btn.config(state="normal")
                 self.save_btn.config(state="normal")
                 self.view_eeg_btn.config(state="normal")
                 self.back_btn.config(state="normal")
@@ -322,6 +640,7 @@ class EEGAnalyzerApp:
                 self.scroll_right_btn.config(state="normal")
                 self.zoom_in_btn.config(state="normal")
                 self.zoom_out_btn.config(state="normal")
+                self.play_btn.config(state="normal")
 
                 # Активируем первый канал
                 self.channel_buttons[0].config(bg="#2196F3", fg="white")
@@ -332,6 +651,14 @@ class EEGAnalyzerApp:
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Не удалось загрузить файл:\n{str(e)}")
 
+    def build_indexes(self, pyramid, window_stats):
+        """Фоновое построение пирамиды огибающих и индекса статистики окон"""
+        try:
+            pyramid.build()
+            window_stats.build()
+        except Exception as e:
+            print(f"Не удалось построить индексы записи: {e}")
+
     def switch_channel(self, channel_idx):
         """Переключает отображаемый канал ЭЭГ"""
         if self.data is None or self.current_view != 'eeg':
@@ -347,7 +674,7 @@ class EEGAnalyzerApp:
                 btn.config(bg="#E0E0E0", fg="black")
 
         # Перерисовываем ЭЭГ
-        self.update_eeg_display()
+        self.request_eeg_redraw()
 
     def set_time_window(self, seconds):
         """Устанавливает временное окно для отображения"""
@@ -355,7 +682,7 @@ class EEGAnalyzerApp:
             return
 
         self.eeg_display_seconds = seconds
-        self.update_eeg_display()
+        self.request_eeg_redraw()
 
     def scroll_left(self):
         """Прокрутка назад во времени"""
@@ -365,7 +692,9 @@ class EEGAnalyzerApp:
         new_start = max(0, self.eeg_start_time - self.eeg_display_seconds * 0.5)
         if new_start != self.eeg_start_time:
             self.eeg_start_time = new_start
-            self.update_eeg_display()
+            self.eeg_scroll_direction = -1
+            self.playback.seek(new_start)
+            self.request_eeg_redraw(interactive=True)
 
     def scroll_right(self):
         """Прокрутка вперед во времени"""
@@ -376,7 +705,9 @@ class EEGAnalyzerApp:
         new_start = min(max_start, self.eeg_start_time + self.eeg_display_seconds * 0.5)
         if new_start != self.eeg_start_time:
             self.eeg_start_time = new_start
-            self.update_eeg_display()
+            self.eeg_scroll_direction = 1
+            self.playback.seek(new_start)
+            self.request_eeg_redraw(interactive=True)
 
     def zoom_in(self):
         """Уменьшает временное окно (зум внутрь)"""
@@ -385,7 +716,7 @@ class EEGAnalyzerApp:
 
         if self.eeg_display_seconds > 1:
             self.eeg_display_seconds = max(1, self.eeg_display_seconds // 2)
-            self.update_eeg_display()
+            self.request_eeg_redraw()
 
     def zoom_out(self):
         """Увеличивает временное окно (зум наружу)"""
@@ -394,7 +725,199 @@ class EEGAnalyzerApp:
 
         if self.eeg_display_seconds < 300:  # Максимум 5 минут
             self.eeg_display_seconds = min(300, self.eeg_display_seconds * 2)
-            self.update_eeg_display()
+            self.request_eeg_redraw()
+
+    def on_show_delta_wave_changed(self):
+        """Включение/выключение наложения дельта-волны"""
+        self.show_delta_wave = self.show_delta_wave_var.get()
+        self.request_eeg_redraw()
+
+    def on_show_frame_stats_changed(self):
+        """Включение/выключение отладочной подписи со временем кадра"""
+        self.show_frame_stats = self.show_frame_stats_var.get()
+        self.request_eeg_redraw()
+
+    def on_fast_trace_changed(self):
+        """Переключение между быстрой отрисовкой на tk.Canvas и фигурой matplotlib"""
+        previous = self.eeg_widget()
+        self.fast_trace = self.fast_trace_var.get()
+        if self.current_view == 'eeg':
+            self.show_canvas(self.eeg_widget(), previous)
+        # Фигура могла устареть, пока просмотр шел на tk.Canvas
+        self.eeg_layout = None
+        self.request_eeg_redraw()
+
+    def on_montage_changed(self):
+        """Переключение между одним каналом и монтажом всех каналов"""
+        self.montage = self.montage_var.get()
+        # Масштаб по Y у видов разный: подбирается заново
+        self.eeg_layout = None
+        self.trace_canvas.ylim = None
+        self.request_eeg_redraw()
+
+    def on_sensitivity_changed(self, event=None):
+        """Смена чувствительности монтажа (мкВ/мм)"""
+        self.montage_sensitivity = float(self.sensitivity_combo.get().split()[0])
+        self.request_eeg_redraw()
+
+    def request_eeg_redraw(self, interactive=False):
+        """Запрос перерисовки ЭЭГ: частые запросы объединяются в одну отрисовку за кадр
+
+        interactive - запрос от непрерывной навигации (удержание прокрутки, перетаскивание): если действия
+        идут чаще паузы interaction_idle_ms, кадры рисуются в черновом качестве до наступления паузы.
+        """
+        if interactive:
+            self.note_interaction()
+        self.eeg_redraw.request()
+
+    def note_interaction(self):
+        now = time.perf_counter()
+        if now - self.last_interaction < self.interaction_idle_ms / 1000:
+            self.draft_quality = True
+        self.last_interaction = now
+        if self.refine_pending is not None:
+            self.root.after_cancel(self.refine_pending)
+        self.refine_pending = self.root.after(self.interaction_idle_ms, self.refine_eeg_quality)
+
+    def refine_eeg_quality(self):
+        """Пауза во вводе: последний кадр перерисовывается в полном качестве"""
+        self.refine_pending = None
+        if self.draft_quality and not self.playback.running:
+            self.draft_quality = False
+            self.request_eeg_redraw()
+
+    def eeg_points(self, plot_width):
+        """Число точек огибающей на график шириной plot_width пикселей с учетом текущего качества"""
+        per_pixel = self.draft_points_per_pixel if self.draft_quality else self.points_per_pixel
+        return max(2, int(per_pixel * plot_width))
+
+    def toggle_playback(self):
+        if self.playback.running:
+            self.stop_playback()
+        else:
+            self.start_playback()
+
+    def start_playback(self):
+        """Непрерывная прокрутка окна со скоростью playback_speed (кадры рисуются черновыми, блиттингом)"""
+        if self.data is None or self.current_view != 'eeg':
+            return
+        if self.eeg_start_time >= self.total_duration - self.eeg_display_seconds:
+            self.eeg_start_time = 0
+        self.eeg_scroll_direction = 1
+        self.draft_quality = True
+        self.eeg_redraw.cancel()
+        self.playback.start(self.eeg_start_time, self.playback_speed)
+        self.play_btn.config(text="⏸ ПАУЗА")
+
+    def stop_playback(self):
+        """Остановка воспроизведения; последний кадр перерисовывается в полном качестве"""
+        if not self.playback.running:
+            return
+        self.playback.stop()
+        self.play_btn.config(text="▶ ВОСПРОИЗВЕДЕНИЕ")
+        self.draft_quality = False
+        self.request_eeg_redraw()
+
+    def on_playback_speed_changed(self, event=None):
+        self.playback_speed = float(self.playback_speed_combo.get().lstrip("×"))
+        self.playback.set_speed(self.playback_speed)
+
+    def playback_frame(self, position):
+        """Кадр воспроизведения по часам: окно сдвигается к положению position и рисуется сразу"""
+        if self.data is None or self.current_view != 'eeg':
+            self.stop_playback()
+            return False
+        max_start = max(0, self.total_duration - self.eeg_display_seconds)
+        self.eeg_start_time = min(max(0, position), max_start)
+        self.update_eeg_display()
+        if self.eeg_start_time >= max_start:
+            self.stop_playback()
+            return False
+
+    def window_trace(self):
+        """Трасса текущего окна: срез кольца воспроизведения или данные из кэша окон
+
+        Формат как у ключа кэша: (номера отсчетов, значения) для одного канала,
+        (середины корзин, минимумы, максимумы) по всем каналам для монтажа.
+        """
+        if not self.playback.running:
+            return self.window_cache.get(self.window_keys(self.eeg_start_time)[0])
+
+        window = int(self.eeg_display_seconds * self.fs)
+        max_points = self.eeg_points(self.eeg_plot_width)
+        # Корзина - степень двойки: корзины ложатся на блоки уровней пирамиды без остатка
+        bucket = 1 if window <= max_points else 1 << int(np.ceil(np.log2(2 * window / max_points)))
+        capacity = 3 * (window // bucket + 2)
+        ring = self.playback_ring
+        if ring is None or ring.bucket != bucket or ring.capacity != capacity:
+            ring = FrameRing(lambda start, stop, n_buckets: self.compute_window(('montage', start, stop, n_buckets))[1:],
+                             len(self.data), self.display_channel_count(), bucket, capacity)
+            self.playback_ring = ring
+
+        start_idx = int(self.eeg_start_time * self.fs)
+        positions, low, high = ring.frame(start_idx, start_idx + window)
+        if self.montage:
+            return positions, low, high
+        if low is high:
+            return positions, low[:, self.current_channel]
+        return (np.repeat(positions, 2),
+                np.stack((low[:, self.current_channel], high[:, self.current_channel]), axis=1).ravel())
+
+    def window_label(self, window_start, window_end):
+        """Подпись окна; при воспроизведении - со скоростью и счетчиком пропущенных кадров"""
+        text = f'Окно: {window_start:.1f}-{window_end:.1f} сек'
+        if self.playback.running:
+            text += f'  ▶ {self.playback.stats_text()}'
+        return text
+
+    def get_delta_waveform(self, channel):
+        """Реальная дельта-активность канала без фазового сдвига: (волна, частота) или None, пока не готова
+
+        Волна считается один раз на канал в фоновом потоке по децимированной записи анализа
+        (из кэша, иначе децимация выполняется в том же потоке и тоже кэшируется).
+        """
+        if channel in self.delta_wave_cache:
+            return self.delta_wave_cache[channel]
+        key = (channel, self.freq_bands['delta'])
+        if self.delta_wave_job is None or self.delta_wave_key != key:
+            if self.delta_wave_job is not None:
+                self.delta_wave_job.cancel()
+            fs = self.get_analysis_fs()
+            decimated = (self.data, None) if fs == self.fs else self.decimated_cache.get(fs)
+            self.delta_wave_key = key
+            self.delta_wave_job = BackgroundJob(self.prepare_delta_waveform, self.data, fs, decimated, *key)
+            self.root.after(50, self.poll_delta_waveform, self.delta_wave_job, key, fs)
+        return None
+
+    def prepare_delta_waveform(self, job, recording, fs, decimated, channel, band):
+        """Фоновый поток: децимированная запись анализа (если ее нет в кэше) и дельта-волна канала"""
+        if decimated is None:
+            job.stage = "децимация"
+            decimated = self.decimate_recording(recording, fs, job.report)
+        f_low, f_high = band
+        return decimated, band_limited_waveform(decimated[0][:, channel], fs, f_low, f_high)
+
+    def poll_delta_waveform(self, job, key, fs):
+        """По готовности дельта-волны - кэширование и перерисовка с наложением"""
+        if job is not self.delta_wave_job:
+            return
+        if not job.done():
+            self.root.after(50, self.poll_delta_waveform, job, key, fs)
+            return
+
+        self.delta_wave_job = None
+        channel, band = key
+        if job.error is not None:
+            # Ошибка запоминается, чтобы каждая перерисовка не запускала вычисление заново
+            print(f"Ошибка вычисления дельта-волны: {job.error}")
+            result = None
+        else:
+            decimated, result = job.result
+            if fs != self.fs and fs not in self.decimated_cache:
+                self.decimated_cache[fs] = decimated
+        if band == self.freq_bands['delta']:
+            self.delta_wave_cache[channel] = result
+            self.request_eeg_redraw()
 
     def view_raw_eeg(self):
         """Просмотр исходных сигналов ЭЭГ"""
@@ -402,11 +925,11 @@ class EEGAnalyzerApp:
             return
 
         try:
+            # Положение и масштаб просмотра сохраняются между переключениями видов
+            if self.current_view != 'eeg':
+                self.saved_analysis_text = (self.results_label.cget("text"), self.results_text.get(1.0, tk.END))
+                self.show_canvas(self.eeg_widget(), self.canvas.get_tk_widget())
             self.current_view = 'eeg'
-            self.eeg_start_time = 0  # Сбрасываем к началу
-
-            # Настраиваем сетку для ЭЭГ
-            self.setup_eeg_grid()
 
             # Показываем управление ЭЭГ
             self.eeg_control_frame.pack(pady=10)
@@ -418,74 +941,393 @@ class EEGAnalyzerApp:
             messagebox.showerror("Ошибка", f"Не удалось отобразить ЭЭГ:\n{str(e)}")
 
     def update_eeg_display(self):
-        """Обновляет отображение ЭЭГ"""
+        """Обновляет отображение ЭЭГ (на tk.Canvas в быстром режиме, иначе в фигуре matplotlib)"""
         if self.data is None or self.current_view != 'eeg':
             return
 
         try:
-            # Очищаем графики
-            self.ax_eeg.clear()
-            self.ax_minimap.clear()
-
-            # Получаем данные текущего канала
-            channel_data = self.data[:, self.current_channel]
-            time = np.arange(len(channel_data)) / self.fs
-
-            # Определяем диапазон для отображения
-            start_idx = int(self.eeg_start_time * self.fs)
-            end_idx = int((self.eeg_start_time + self.eeg_display_seconds) * self.fs)
-            end_idx = min(end_idx, len(channel_data))
-
-            # Данные для основного графика
-            display_data = channel_data[start_idx:end_idx]
-            display_time = time[start_idx:end_idx]
-
-            # Основной график ЭЭГ
-            self.ax_eeg.plot(display_time, display_data, color='#2196F3', linewidth=1)
-            self.ax_eeg.set_title(f'ЭЭГ - Канал {self.channel_names[self.current_channel]}',
-                                  fontweight='bold', fontsize=14)
-            self.ax_eeg.set_ylabel('Амплитуда (мкВ)', fontsize=12)
-            self.ax_eeg.set_xlabel('Время (секунды)', fontsize=12)
-            self.ax_eeg.grid(True, alpha=0.3)
-
-            # Автоматическое масштабирование по Y
-            y_margin = (np.max(display_data) - np.min(display_data)) * 0.1
-            if y_margin == 0:  # Если сигнал постоянный
-                y_margin = 1
-            self.ax_eeg.set_ylim(np.min(display_data) - y_margin, np.max(display_data) + y_margin)
+            if self.fast_trace:
+                self.draw_eeg_trace_canvas()
+            else:
+                self.draw_eeg_figure()
 
-            # Мини-карта всего сигнала
-            self.ax_minimap.plot(time, channel_data, color='gray', linewidth=0.5, alpha=0.7)
+            # Информация об окне обновляется, когда навигация остановилась
+            if not self.draft_quality:
+                self.update_eeg_info()
 
-            # Показываем текущее окно на мини-карте
-            window_start = self.eeg_start_time
-            window_end = self.eeg_start_time + self.eeg_display_seconds
+            # При воспроизведении кадры берутся из кольца, соседние окна не нужны
+            if not self.playback.running:
+                self.prefetch_adjacent_windows()
 
-            self.ax_minimap.axvspan(window_start, window_end, alpha=0.3, color='red')
-            self.ax_minimap.set_xlim(0, self.total_duration)
-            self.ax_minimap.set_ylabel('Вся запись', fontsize=8)
-            self.ax_minimap.tick_params(axis='both', which='major', labelsize=6)
-            self.ax_minimap.grid(True, alpha=0.2)
+        except Exception as e:
+            print(f"Ошибка при обновлении ЭЭГ: {e}")
 
+    def window_keys(self, start_time):
+        """Ключи кэша окон, нужные для кадра с началом start_time в текущем режиме просмотра"""
+        start_idx = int(start_time * self.fs)
+        end_idx = min(len(self.data), int((start_time + self.eeg_display_seconds) * self.fs))
+        if self.montage:
+            trace = ('montage', start_idx, end_idx, max(1, self.eeg_points(self.eeg_plot_width) // 2))
+        else:
+            trace = ('channel', self.current_channel, start_idx, end_idx, self.eeg_points(self.eeg_plot_width))
+        return [trace, ('stats', self.current_channel, start_idx, end_idx)]
+
+    def compute_window(self, key):
+        """Данные окна по ключу кэша (вызывается и из фонового потока предвыборки)"""
+        kind = key[0]
+        if kind == 'channel':
+            _, channel, start_idx, end_idx, max_points = key
+            return self.channel_envelope(channel, start_idx, end_idx, max_points)
+        if kind == 'montage':
+            _, start_idx, end_idx, n_buckets = key
+            if self.pyramid is not None:
+                return self.pyramid.block_envelope(start_idx, end_idx, n_buckets)
+            return block_envelope(self.data[:, :self.display_channel_count()], start_idx, end_idx, n_buckets)
+        _, channel, start_idx, end_idx = key
+        return self.window_stats.window(channel, start_idx, end_idx)
+
+    def prefetch_adjacent_windows(self):
+        """Фоновый расчет окон, к которым вероятнее всего перейдет прокрутка (сначала по направлению движения)"""
+        step = self.eeg_display_seconds * 0.5
+        forward = min(self.total_duration - self.eeg_display_seconds, self.eeg_start_time + step)
+        backward = max(0, self.eeg_start_time - step)
+        starts = (forward, backward) if self.eeg_scroll_direction > 0 else (backward, forward)
+        keys = []
+        for start_time in starts:
+            if start_time != self.eeg_start_time:
+                keys.extend(self.window_keys(start_time))
+        self.window_cache.prefetch(keys)
+
+    def eeg_window_data(self, plot_width):
+        """Прореженный сигнал текущего окна и дельта-волна: (время, значения, прорежен ли, дельта или None)"""
+        # Определяем диапазон для отображения
+        start_idx = int(self.eeg_start_time * self.fs)
+        end_idx = int((self.eeg_start_time + self.eeg_display_seconds) * self.fs)
+        end_idx = min(end_idx, len(self.data))
+
+        # min/max огибающая, ~2 точки на пиксель при любой длине окна (из кэша окон или кольца воспроизведения)
+        self.eeg_plot_width = plot_width
+        display_idx, display_data = self.window_trace()
+
+        # Время по X отсчитывается от начала окна, чтобы оси не менялись при прокрутке
+        display_time = display_idx / self.fs - self.eeg_start_time
+
+        # Дельта-волна поверх сигнала (на уровне среднего в окне)
+        delta = None
+        waveform = self.get_delta_waveform(self.current_channel) if self.show_delta_wave else None
+        if waveform is not None:
+            wave, wave_fs = waveform
+            wave_start = int(self.eeg_start_time * wave_fs)
+            wave_end = min(len(wave), int(np.ceil(end_idx / self.fs * wave_fs)) + 1)
+            delta = (np.arange(wave_start, wave_end) / wave_fs - self.eeg_start_time,
+                     wave[wave_start:wave_end] + self.window_mean(start_idx, end_idx))
+
+        return display_time, display_data, len(display_data) < end_idx - start_idx, delta
+
+    def eeg_ylim(self, ylim, display_data):
+        """Масштаб по Y меняется только если сигнал вышел за пределы или стал заметно мельче"""
+        y_low, y_high = np.min(display_data), np.max(display_data)
+        if (ylim is None or y_low < ylim[0] or y_high > ylim[1]
+                or (y_high - y_low) < 0.5 * (ylim[1] - ylim[0])):
+            y_margin = (y_high - y_low) * 0.1
+            if y_margin == 0:  # Если сигнал постоянный
+                y_margin = 1
+            ylim = (y_low - y_margin, y_high + y_margin)
+        return ylim
+
+    def montage_window_data(self, plot_width, height_mm):
+        """Окно всех каналов в миллиметрах монтажа: (время, нижняя огибающая, верхняя, прорежен ли, базовые линии)
+
+        Огибающая считается одним векторным проходом по блоку (отсчеты × каналы); из каждого канала
+        вычитается его среднее по всей записи, так что базовые линии не прыгают при прокрутке и воспроизведении.
+        """
+        self.eeg_plot_width = plot_width
+        positions, low, high = self.window_trace()
+        decimated = low is not high
+
+        n_channels = self.display_channel_count()
+        baselines = height_mm * (n_channels - np.arange(n_channels) - 0.5) / n_channels
+        if self.window_stats.ready:
+            centers = np.array([self.window_stats.whole(i)[2] for i in range(n_channels)])
+        else:
+            # Пока индекс строится - середина окна: проход по всей записи в потоке Tk недопустим
+            centers = (low.min(axis=0) + high.max(axis=0)) / 2
+        low = (low - centers) / self.montage_sensitivity + baselines
+        high = (high - centers) / self.montage_sensitivity + baselines if decimated else low
+        return positions / self.fs - self.eeg_start_time, low, high, decimated, baselines
+
+    def display_channel_count(self):
+        """Число отображаемых каналов: именованные каналы, которые есть в записи (лишние столбцы не показываются)"""
+        return min(self.data.shape[1], len(self.channel_names))
+
+    def montage_labels(self):
+        """Подписи каналов монтажа"""
+        return self.channel_names[:self.display_channel_count()]
+
+    def draw_eeg_trace_canvas(self):
+        """Кадр быстрого просмотра: координаты ломаных на tk.Canvas обновляются на месте"""
+        trace_canvas = self.trace_canvas
+        window_start = self.eeg_start_time
+        window_end = self.eeg_start_time + self.eeg_display_seconds
+
+        if self.montage:
+            height_mm = trace_canvas.plot_height_mm()
+            times, low, high, decimated, baselines = self.montage_window_data(trace_canvas.plot_width(), height_mm)
+            if decimated:
+                # Минимум и максимум корзины подряд: вертикальный штрих на пиксель
+                times = np.repeat(times, 2)
+                values = np.stack((low, high), axis=1).reshape(len(times), -1)
+            else:
+                values = low
+            traces = [(times, values[:, i], '#2196F3', 1) for i in range(values.shape[1])]
+            ylim = (0, height_mm)
+            title = f'ЭЭГ - все каналы ({self.montage_sensitivity:g} мкВ/мм)'
+            fixed_y_ticks = list(zip(baselines, self.montage_labels()))
+            y_title = 'Каналы'
+        else:
+            display_time, display_data, _, delta = self.eeg_window_data(trace_canvas.plot_width())
+            ylim = self.eeg_ylim(trace_canvas.ylim, display_data)
+            traces = [(display_time, display_data, '#2196F3', 1)]
+            if delta is not None:
+                traces.append((delta[0], delta[1], '#FF5722', 2))
+            title = f'ЭЭГ - Канал {self.channel_names[self.current_channel]}'
+            fixed_y_ticks = None
+            y_title = 'Амплитуда (мкВ)'
+
+        minimap = self.get_minimap_envelope(trace_canvas.plot_width())
+        minimap_margin = max((np.max(minimap[1]) - np.min(minimap[1])) * 0.05, 1e-9)
+        trace_canvas.draw(traces, (0, self.eeg_display_seconds), ylim, title=title,
+                          window_text=self.window_label(window_start, window_end),
+                          stats_text=self.eeg_redraw.stats_text() if self.show_frame_stats else '',
+                          minimap=minimap,
+                          minimap_ylim=(np.min(minimap[1]) - minimap_margin, np.max(minimap[1]) + minimap_margin),
+                          total_duration=self.total_duration, span=(window_start, window_end),
+                          fixed_y_ticks=fixed_y_ticks, y_title=y_title,
+                          selection=None if self.region is None else (self.region[0] - window_start,
+                                                                      self.region[1] - window_start))
+        if not self.montage:
+            trace_canvas.ylim = ylim
+        else:
+            # Масштаб одного канала подбирается заново после выхода из монтажа
+            trace_canvas.ylim = None
+
+    def draw_eeg_figure(self):
+        """Кадр просмотра в фигуре matplotlib
+
+        Обновляются данные готовых художников; полная перерисовка холста нужна только при смене
+        размера окна, масштаба по Y, канала мини-карты или наложения, иначе - блиттинг.
+        """
+        window_start = self.eeg_start_time
+        window_end = self.eeg_start_time + self.eeg_display_seconds
+        self.eeg_window_text.set_text(self.window_label(window_start, window_end))
+        # Время предыдущего кадра (текущий еще рисуется)
+        self.frame_stats_text.set_visible(self.show_frame_stats)
+        self.frame_stats_text.set_text(self.eeg_redraw.stats_text())
+
+        # В черновых кадрах сглаживание отключается: Agg рисует заметно быстрее
+        for artist in (self.eeg_line, self.eeg_band, self.delta_line, self.montage_lines, self.montage_bands):
+            artist.set_antialiased(not self.draft_quality)
+
+        if self.montage:
+            ylim, baselines = self.update_montage_artists()
+        else:
+            ylim = self.update_channel_artists()
+
+        # Выделенный участок в координатах окна (вне окна отсекается осями)
+        self.region_span.set_visible(self.region is not None)
+        if self.region is not None:
+            self.region_span.set_x(self.region[0] - window_start)
+            self.region_span.set_width(self.region[1] - self.region[0])
+
+        # Мини-карта всего сигнала и текущее окно на ней
+        minimap_time, minimap_data = self.get_minimap_envelope(axes_pixel_width(self.ax_minimap))
+        self.minimap_line.set_data(minimap_time, minimap_data)
+        self.minimap_span.set_x(window_start)
+        self.minimap_span.set_width(window_end - window_start)
+
+        layout = (self.montage, self.montage_sensitivity, self.eeg_display_seconds, ylim, self.current_channel,
+                  self.show_delta_wave, self.total_duration, self.region)
+        if layout != self.eeg_layout:
+            self.update_region_inset()
+            self.ax_eeg.set_xlim(0, self.eeg_display_seconds)
+            self.ax_eeg.set_ylim(*ylim)
+            if self.montage:
+                self.eeg_title.set_text(f'ЭЭГ - все каналы ({self.montage_sensitivity:g} мкВ/мм)')
+                self.ax_eeg.set_yticks(baselines, self.montage_labels())
+                self.ax_eeg.set_ylabel('Каналы', fontsize=12)
+            else:
+                self.eeg_title.set_text(f'ЭЭГ - Канал {self.channel_names[self.current_channel]}')
+                self.ax_eeg.yaxis.set_major_locator(AutoLocator())
+                self.ax_eeg.yaxis.set_major_formatter(ScalarFormatter())
+                self.ax_eeg.set_ylabel('Амплитуда (мкВ)', fontsize=12)
+            self.delta_legend.set_visible(self.show_delta_wave and not self.montage)
+            self.ax_minimap.set_xlim(0, self.total_duration)
+            minimap_margin = max((np.max(minimap_data) - np.min(minimap_data)) * 0.05, 1e-9)
+            self.ax_minimap.set_ylim(np.min(minimap_data) - minimap_margin, np.max(minimap_data) + minimap_margin)
             # Убираем метки по Y на мини-карте для экономии места
             self.ax_minimap.set_yticklabels([])
+            self.eeg_layout = layout
+            self.eeg_canvas.draw()
+        else:
+            self.eeg_blit.update()
+
+    def update_channel_artists(self):
+        """Художники одного канала (сигнал и дельта-волна); возвращает масштаб по Y"""
+        display_time, display_data, decimated, delta = self.eeg_window_data(axes_pixel_width(self.ax_eeg))
 
-            self.fig.tight_layout()
-            self.canvas.draw()
+        self.delta_line.set_visible(delta is not None)
+        if delta is not None:
+            self.delta_line.set_data(*delta)
 
-            # Обновляем информацию
-            self.update_eeg_info()
+        ylim = self.eeg_ylim(self.ax_eeg.get_ylim() if self.eeg_layout is not None else None, display_data)
 
+        if decimated:
+            # Полоса не тоньше пикселя, иначе тихие участки пропадают
+            pixel_height = (ylim[1] - ylim[0]) / max(1, self.ax_eeg.get_window_extent().height)
+            self.eeg_band.set_xy(envelope_polygon(display_time, display_data, pixel_height))
+        else:
+            self.eeg_line.set_data(display_time, display_data)
+        self.eeg_band.set_visible(decimated)
+        self.eeg_line.set_visible(not decimated)
+        self.montage_bands.set_visible(False)
+        self.montage_lines.set_visible(False)
+        return ylim
+
+    def update_montage_artists(self):
+        """Коллекции монтажа всех каналов; ось Y в миллиметрах экрана. Возвращает (масштаб по Y, базовые линии)"""
+        extent = self.ax_eeg.get_window_extent()
+        # Тот же масштаб экрана, что у холста быстрого просмотра, а не dpi рисунка
+        pixels_per_mm = self.eeg_canvas.get_tk_widget().winfo_fpixels('1m')
+        height_mm = round(extent.height / pixels_per_mm, 1)
+        times, low, high, decimated, baselines = self.montage_window_data(max(1, int(extent.width)), height_mm)
+
+        if decimated:
+            self.montage_bands.set_verts(montage_polygons(times, low, high, 1 / pixels_per_mm))
+        else:
+            self.montage_lines.set_segments(np.stack((np.broadcast_to(times, low.T.shape), low.T), axis=2))
+        self.montage_bands.set_visible(decimated)
+        self.montage_lines.set_visible(not decimated)
+        for artist in (self.eeg_line, self.eeg_band, self.delta_line):
+            artist.set_visible(False)
+        return (0, height_mm), baselines
+
+    def get_segment_spectra(self):
+        """Накопленные периодограммы сегментов Уэлча записи (один раз на частоту анализа, фильтр и маску)"""
+        data, fs = self.get_analysis_data()
+        nperseg = int(self.welch_segment_seconds * fs)
+        key = (fs, self.filter_mode, nperseg, self.reject_artifacts)
+        if key not in self.segment_spectra_cache:
+            segment_mask = self.get_segment_mask(fs, len(data), nperseg)
+            self.segment_spectra_cache[key] = self.build_segment_spectra(data, fs, nperseg, segment_mask)
+        return self.segment_spectra_cache[key]
+
+    def build_segment_spectra(self, data, fs, nperseg, segment_mask, progress=None):
+        """Периодограммы сегментов и взаимные спектры всех каналов за один проход по записи"""
+        return SegmentSpectra(data, fs, nperseg, segment_mask=segment_mask, cross_channels=len(self.channel_names),
+                              progress=progress)
+
+    def on_region_selected(self, xmin, xmax):
+        """Выделение участка мышью (секунды от начала окна): спектр участка из периодограмм сегментов"""
+        if self.data is None or xmax - xmin < 0.05:
+            return
+        self.region = (max(0.0, self.eeg_start_time + xmin), min(self.total_duration, self.eeg_start_time + xmax))
+        self.region_result = None
+        self.show_region_analysis()
+
+    def show_region_analysis(self):
+        """Спектр выделенного участка; без готовых периодограмм - после их фоновой подготовки"""
+        if self.region is None or not self.analysis_ready(True, self.show_region_analysis):
+            self.request_eeg_redraw()
+            return
+        try:
+            self.analyze_region()
         except Exception as e:
-            print(f"Ошибка при обновлении ЭЭГ: {e}")
+            self.region = None
+            self.region_result = None
+            messagebox.showerror("Ошибка", f"Не удалось проанализировать участок:\n{str(e)}")
+        self.request_eeg_redraw()
+
+    def clear_region(self):
+        self.region = None
+        self.region_result = None
+        self.request_eeg_redraw()
+
+    def analyze_region(self):
+        """СПМ и мощности ритмов выделенного участка: среднее готовых периодограмм его сегментов"""
+        segment_spectra = self.get_segment_spectra()
+        if len(segment_spectra) == 0:
+            raise ValueError("Запись короче сегмента Уэлча")
+        fs = segment_spectra.fs
+        first, last = segment_spectra.segment_range(self.region[0] * fs, self.region[1] * fs)
+        if segment_spectra.segment_count(first, last) == 0:
+            raise ValueError("Все сегменты участка исключены как артефакты")
+        psd = segment_spectra.psd(first, last)
+        freqs = segment_spectra.freqs
+        self.region_result = {'freqs': freqs, 'psd': psd, 'powers': self.region_powers(psd, freqs),
+                              'segments': (first, last), 'included': segment_spectra.segment_count(first, last),
+                              'fs': fs}
+
+    def region_powers(self, psd, freqs):
+        """Мощности ритмов участка по каналам (список словарей ритм -> мощность)"""
+        return [{band: self.compute_band_power(psd[i], freqs, f_low, f_high)
+                 for band, (f_low, f_high) in self.freq_bands.items()}
+                for i in range(psd.shape[0])]
+
+    def update_region_inset(self):
+        """Вставка со спектром выделенного участка для текущего канала"""
+        result = self.region_result
+        self.ax_region.set_visible(result is not None)
+        if result is None:
+            return
+        freqs = result['freqs']
+        psd = result['psd'][self.current_channel]
+        self.region_line.set_data(freqs, psd)
+        self.ax_region.set_xlim(0, min(45.0, freqs[-1]))
+        self.ax_region.set_ylim(0, max(np.max(psd[freqs <= 45.0]) * 1.1, 1e-12))
+        self.region_title.set_text(f'СПМ участка, {self.montage_labels()[self.current_channel]}')
+
+    def region_report(self):
+        """Текст отчета по выделенному участку"""
+        start, stop = self.region
+        first, last = self.region_result['segments']
+        text = f"\nВыделенный участок: {start:.2f}-{stop:.2f} сек ({stop - start:.2f} сек)\n"
+        text += "-" * 40 + "\n"
+        text += (f"Сегментов Уэлча: {last - first} по {self.welch_segment_seconds} сек, "
+                 f"частота анализа {self.region_result['fs']} Гц\n")
+        if self.region_result['included'] < last - first:
+            text += f"Исключено сегментов с артефактами: {last - first - self.region_result['included']}\n"
+        if stop - start < self.welch_segment_seconds:
+            text += "Участок короче сегмента: взят ближайший к его середине сегмент\n"
+        for name, powers in zip(self.montage_labels(), self.region_result['powers']):
+            text += (f"🔹 {name}: Δ: {powers['delta']:6.2f} | θ: {powers['theta']:6.2f} | "
+                     f"α: {powers['alpha']:6.2f} | β: {powers['beta']:6.2f} | γ: {powers['gamma']:6.2f} мкВ²/Гц\n")
+        return text
+
+    def channel_envelope(self, channel, start_idx, end_idx, max_points):
+        """Огибающая участка канала: с уровня пирамиды, если она готова, иначе по сырым отсчетам"""
+        if self.pyramid is not None:
+            return self.pyramid.envelope(channel, start_idx, end_idx, max_points)
+        return envelope_decimate(self.data[:, channel], start_idx, end_idx, max_points)
+
+    def window_mean(self, start_idx, end_idx):
+        """Среднее текущего канала на участке (по накопленным суммам индекса статистики)"""
+        return self.window_stats.moments(self.current_channel, start_idx, end_idx)[0]
+
+    def get_minimap_envelope(self, plot_width):
+        """Огибающая всей записи канала для мини-карты (вычисляется один раз на канал и ширину)"""
+        max_points = self.points_per_pixel * plot_width
+        key = (self.current_channel, max_points)
+        if key not in self.minimap_cache:
+            indices, values = self.channel_envelope(self.current_channel, 0, len(self.data), max_points)
+            self.minimap_cache[key] = (indices / self.fs, values)
+        return self.minimap_cache[key]
 
     def update_eeg_info(self):
         """Обновляет информацию о ЭЭГ в текстовом поле"""
         self.results_text.delete(1.0, tk.END)
 
-        channel_data = self.data[:, self.current_channel]
-        current_segment = channel_data[int(self.eeg_start_time * self.fs):int(
-            (self.eeg_start_time + self.eeg_display_seconds) * self.fs)]
+        window_min, window_max, window_mean, window_std = self.window_cache.get(self.window_keys(self.eeg_start_time)[1])
+        totals = self.window_stats.whole(self.current_channel)
 
         info_text = f"ПРОСМОТР ЭЭГ - КАНАЛ {self.channel_names[self.current_channel]}\n"
         info_text += "=" * 60 + "\n\n"
@@ -498,10 +1340,27 @@ class EEGAnalyzerApp:
 
         info_text += f"\nСтатистика текущего окна:\n"
         info_text += "-" * 40 + "\n"
-        info_text += f"• Минимум: {np.min(current_segment):.2f} мкВ\n"
-        info_text += f"• Максимум: {np.max(current_segment):.2f} мкВ\n"
-        info_text += f"• Среднее: {np.mean(current_segment):.2f} мкВ\n"
-        info_text += f"• Стандартное отклонение: {np.std(current_segment):.2f} мкВ\n"
+        info_text += f"• Минимум: {window_min:.2f} мкВ\n"
+        info_text += f"• Максимум: {window_max:.2f} мкВ\n"
+        info_text += f"• Среднее: {window_mean:.2f} мкВ\n"
+        info_text += f"• Стандартное отклонение: {window_std:.2f} мкВ\n"
+
+        info_text += f"\nСтатистика всей записи:\n"
+        info_text += "-" * 40 + "\n"
+        if totals is None:
+            info_text += "• Вычисляется...\n"
+        else:
+            total_min, total_max, total_mean, total_std = totals
+            info_text += f"• Минимум: {total_min:.2f} мкВ\n"
+            info_text += f"• Максимум: {total_max:.2f} мкВ\n"
+            info_text += f"• Среднее: {total_mean:.2f} мкВ\n"
+            info_text += f"• Стандартное отклонение: {total_std:.2f} мкВ\n"
+
+        if self.playback.frames:
+            info_text += f"\nПоследнее воспроизведение: {self.playback.stats_text()}\n"
+
+        if self.region_result is not None:
+            info_text += self.region_report()
 
         info_text += f"\nУправление просмотром:\n"
         info_text += "-" * 40 + "\n"
@@ -510,6 +1369,7 @@ class EEGAnalyzerApp:
         info_text += "◀ НАЗАД/ВПЕРЕД ▶ - прокрутка по времени\n"
         info_text += "+/- - изменение размера окна (зум)\n"
         info_text += "• Красная область на мини-карте - текущее положение\n"
+        info_text += "• Выделение мышью на графике - спектр и ритмы участка\n"
 
         self.results_text.insert(1.0, info_text)
         self.results_label.config(text=f"ПРОСМОТР ЭЭГ - {self.channel_names[self.current_channel]}:")
@@ -519,20 +1379,311 @@ class EEGAnalyzerApp:
         if self.data is None:
             return
 
-        self.current_view = 'analysis'
+        self.eeg_redraw.cancel()
+        self.stop_playback()
+        if self.current_view == 'analysis':
+            return
 
-        # Восстанавливаем исходную конфигурацию графиков
-        self.setup_analysis_grid()
-        self.results_label.config(text="РЕЗУЛЬТАТЫ ИЗМЕРЕНИЙ:")
+        # Фигура анализа не перестраивалась: возвращаем ее холст и последние результаты
+        self.current_view = 'analysis'
+        self.show_canvas(self.canvas.get_tk_widget(), self.eeg_widget())
+        label, text = self.saved_analysis_text or ("РЕЗУЛЬТАТЫ ИЗМЕРЕНИЙ:", "Готов к анализу. Выберите тип анализа выше.")
+        self.results_label.config(text=label)
         self.results_text.delete(1.0, tk.END)
-        self.results_text.insert(1.0, "Готов к анализу. Выберите тип анализа выше.")
+        self.results_text.insert(1.0, text.rstrip("\n"))
 
         # Скрываем управление ЭЭГ
         self.eeg_control_frame.pack_forget()
 
-        self.canvas.draw()
+        if self.bands_stale:
+            self.refresh_band_results()
+
+    def show_canvas(self, active, inactive):
+        """Показывает виджет активного вида вместо неактивного (обе фигуры сохраняют свое состояние)"""
+        inactive.pack_forget()
+        active.pack(fill='both', expand=True)
+
+    def eeg_widget(self):
+        """Виджет просмотра ЭЭГ: tk.Canvas быстрого режима или холст фигуры matplotlib"""
+        return self.trace_canvas.canvas if self.fast_trace else self.eeg_canvas.get_tk_widget()
+
+    def on_analysis_fs_changed(self, event=None):
+        """Смена частоты дискретизации для спектрального анализа"""
+        self.analysis_fs = self.analysis_fs_options[self.analysis_fs_combo.get()]
+
+    def on_psd_method_changed(self, event=None):
+        """Смена метода оценки СПМ"""
+        self.psd_method = self.psd_method_options[self.psd_method_combo.get()]
+
+    def on_fft_mode_changed(self, event=None):
+        """Смена способа выбора быстрой длины БПФ"""
+        self.fft_mode = self.fft_mode_options[self.fft_mode_combo.get()]
+
+    def on_filter_changed(self, event=None):
+        """Смена фильтра перед спектральным анализом"""
+        self.filter_mode = self.filter_options[self.filter_combo.get()]
+
+    def on_reject_artifacts_changed(self):
+        """Включение/выключение исключения эпох с артефактами"""
+        self.reject_artifacts = self.reject_artifacts_var.get()
+
+    def band_range(self, band):
+        f_low, f_high = self.freq_bands[band]
+        return f"{f_low:g}-{f_high:g}"
+
+    def on_band_edited(self, event=None):
+        """Изменение границ ритма в редакторе: проверка и немедленное обновление результатов"""
+        try:
+            bands = {band: (float(low.get().replace(',', '.')), float(high.get().replace(',', '.')))
+                     for band, (low, high) in self.band_vars.items()}
+        except ValueError:
+            return  # Число еще набирается
+        if bands == self.freq_bands:
+            return
+        invalid = [band for band, (f_low, f_high) in bands.items() if not 0 <= f_low < f_high]
+        if invalid:
+            self.set_band_fields()
+            messagebox.showerror("Ошибка", f"Нижняя граница ритма {self.band_symbols[invalid[0]]} "
+                                           "должна быть меньше верхней")
+            return
+        too_high = [band for band, (_, f_high) in bands.items() if f_high > self.band_max_freq]
+        if too_high:
+            self.set_band_fields()
+            messagebox.showerror("Ошибка", f"Верхняя граница ритма {self.band_symbols[too_high[0]]} больше "
+                                           f"{self.band_max_freq:g} Гц: выше спектры анализа не считаются")
+            return
+        self.set_freq_bands(bands)
+
+    def delta_view_max(self):
+        """Верхний предел графиков и zoom-спектра дельта-ритма: 6 Гц или с запасом над границей дельты"""
+        return min(self.band_max_freq, max(6.0, float(np.ceil(self.freq_bands['delta'][1])) + 1.0))
+
+    def reset_freq_bands(self):
+        self.set_freq_bands(dict(self.default_freq_bands))
+        self.set_band_fields()
+
+    def set_band_fields(self):
+        for band, fields in self.band_vars.items():
+            for var, value in zip(fields, self.freq_bands[band]):
+                var.set(f"{value:g}")
+
+    def set_freq_bands(self, bands):
+        """Новые диапазоны ритмов; спектры и взаимные спектры не пересчитываются, только интегралы по ним"""
+        if bands == self.freq_bands:
+            return
+        if bands['delta'] != self.freq_bands['delta']:
+            self.delta_wave_cache = {}
+        self.freq_bands = bands
+
+        self.delta_wave_check.config(text=f"Дельта-волна ({self.band_range('delta')} Гц)")
+        self.delta_line.set_label(f"Дельта {self.band_range('delta')} Гц")
+        self.delta_legend.get_texts()[0].set_text(self.delta_line.get_label())
+        if self.region_result is not None:
+            self.region_result['powers'] = self.region_powers(self.region_result['psd'], self.region_result['freqs'])
+
+        if self.current_view == 'eeg':
+            # Результаты анализа обновятся при возврате к нему
+            self.bands_stale = self.shown_analysis is not None
+            self.eeg_layout = None
+            self.request_eeg_redraw()
+        else:
+            self.refresh_band_results()
+
+    def refresh_band_results(self):
+        """Повтор показанного анализа с текущими диапазонами по уже готовым спектрам"""
+        self.bands_stale = False
+        if self.shown_analysis is not None:
+            method, args = self.shown_analysis
+            method(*args)
+
+    def on_limit_to_region_changed(self):
+        """Включение/выключение анализа только выделенного участка"""
+        self.limit_to_region = self.limit_to_region_var.get()
+
+    def get_artifact_mask(self):
+        """Маска эпох с артефактами по исходной записи (вычисляется один раз)"""
+        if self.artifact_cache is None:
+            self.artifact_cache = detect_artifacts(self.data[:, :len(self.channel_names)], self.fs,
+                                                   self.artifact_epoch_seconds)
+        return self.artifact_cache
+
+    def get_segment_mask(self, fs, n_samples, nperseg):
+        """Маска сегментов Уэлча без артефактов или None, если исключение выключено"""
+        if not self.reject_artifacts:
+            return None
+        bad_epochs, _ = self.get_artifact_mask()
+        return segment_mask_from_epochs(bad_epochs, self.artifact_epoch_seconds, fs, n_samples,
+                                        nperseg, nperseg // 2)
+
+    def artifact_summary(self, reject_artifacts):
+        """Строка отчета об исключенных эпохах"""
+        if not reject_artifacts:
+            return "Исключение артефактов: выключено\n"
+        bad_epochs, _ = self.get_artifact_mask()
+        return (f"Исключено эпох с артефактами ({self.artifact_epoch_seconds:g} сек): "
+                f"{np.count_nonzero(bad_epochs)} из {len(bad_epochs)}\n")
+
+    def get_analysis_fs(self):
+        """Частота дискретизации анализа: после децимации или исходная"""
+        if self.analysis_fs is None or self.analysis_fs >= self.fs:
+            return self.fs
+        return self.analysis_fs
+
+    def get_analysis_data(self):
+        """Возвращает запись для спектрального анализа (децимированную, отфильтрованную и закэшированную)"""
+        fs = self.get_analysis_fs()
+        if fs == self.fs:
+            data = self.data
+        else:
+            if fs not in self.decimated_cache:
+                self.decimated_cache[fs] = self.decimate_recording(self.data, fs)
+            data = self.decimated_cache[fs][0]
+
+        if self.filter_mode is None:
+            return data, fs
+
+        key = (fs, self.filter_mode)
+        if key not in self.filtered_cache:
+            self.filtered_cache[key] = self.filter_analysis_data(data, fs, self.filter_mode)
+        return self.filtered_cache[key], fs
+
+    def decimate_recording(self, data, fs, progress=None):
+        """Децимированная до fs копия записи и ее дециматор"""
+        decimator = PolyphaseDecimator(self.fs, fs, passband=50.0)
+        return decimator.process(data, progress=progress), decimator
+
+    def filter_analysis_data(self, data, fs, filter_mode, progress=None):
+        """Отфильтрованная копия данных анализа (запись на диске - в файл кэша блоками)"""
+        # Состояние фильтра - установившееся для первого отсчета, иначе постоянная составляющая дает переходный процесс
+        sos_filter = self.make_filter(fs, filter_mode)
+        sos_filter.initialize(data[0])
+        # Запись на диске фильтруется блоками в файл кэша, полная копия в памяти не создается
+        return filter_recording(sos_filter, data, self.recording_cache_dir, tag=f"{fs}|{filter_mode}",
+                                max_cache_bytes=self.recording_cache_bytes, progress=progress)
+
+    def analysis_ready(self, with_spectra, retry):
+        """Готовы ли данные анализа текущих настроек; если нет - запускает их подготовку в фоновом потоке
+
+        Децимация, фильтрация, поиск артефактов и периодограммы сегментов длинной записи занимают
+        минуты, поэтому считаются не в потоке Tk. Готовые части кладутся в кэши, затем вызывается retry().
+        """
+        fs = self.get_analysis_fs()
+        nperseg = int(self.welch_segment_seconds * fs)
+        keys = (fs, (fs, self.filter_mode), (fs, self.filter_mode, nperseg, self.reject_artifacts))
+        decimated = (self.data, None) if fs == self.fs else self.decimated_cache.get(fs)
+        filtered = self.filtered_cache.get(keys[1])
+        # Артефакты исключаются только из сегментов Уэлча, периодограмме они не нужны
+        need_artifacts = with_spectra and self.reject_artifacts and self.artifact_cache is None
+        need_spectra = with_spectra and keys[2] not in self.segment_spectra_cache
+        if (decimated is not None and (self.filter_mode is None or filtered is not None)
+                and not need_artifacts and not need_spectra):
+            return True
+
+        if self.analysis_batch is not None:
+            self.analysis_batch.cancel()
+        self.analysis_batch = BackgroundJob(self.prepare_analysis_data, self.data, fs, self.filter_mode, nperseg,
+                                            self.reject_artifacts, decimated, filtered, self.artifact_cache, need_spectra)
+        self.results_label.config(text="ПОДГОТОВКА ДАННЫХ...")
+        self.root.after(50, self.poll_preparation, self.analysis_batch, keys, retry)
+        return False
+
+    def prepare_analysis_data(self, job, recording, fs, filter_mode, nperseg, reject_artifacts, decimated, filtered,
+                              artifacts, with_spectra):
+        """Фоновый поток: недостающие данные анализа, без обращения к кэшам приложения
+
+        Возвращает (децимированная запись и дециматор, отфильтрованная запись, маска артефактов, периодограммы).
+        """
+        if decimated is None:
+            job.stage = "децимация"
+            decimated = self.decimate_recording(recording, fs, job.report)
+        data = decimated[0]
+        if filter_mode is not None:
+            if filtered is None:
+                job.stage = "фильтрация"
+                filtered = self.filter_analysis_data(data, fs, filter_mode, job.report)
+            data = filtered
+        if with_spectra and reject_artifacts and artifacts is None:
+            job.stage = "поиск артефактов"
+            artifacts = detect_artifacts(recording[:, :len(self.channel_names)], self.fs, self.artifact_epoch_seconds)
+
+        segment_spectra = None
+        if with_spectra:
+            segment_mask = None
+            if reject_artifacts:
+                segment_mask = segment_mask_from_epochs(artifacts[0], self.artifact_epoch_seconds, fs, len(data),
+                                                        nperseg, nperseg // 2)
+            job.stage = "периодограммы сегментов"
+            segment_spectra = self.build_segment_spectra(data, fs, nperseg, segment_mask, job.report)
+        return decimated, filtered, artifacts, segment_spectra
+
+    def poll_preparation(self, job, keys, retry):
+        """Ход фоновой подготовки данных; по готовности - кэширование и повтор действия"""
+        if job is not self.analysis_batch:
+            return
+        if not job.done():
+            if job.progress is not None:
+                done, total = job.progress
+                self.results_label.config(text=f"ПОДГОТОВКА: {job.stage} {100 * done / max(total, 1):.0f}%...")
+            self.root.after(50, self.poll_preparation, job, keys, retry)
+            return
+
+        self.analysis_batch = None
+        if job.error is not None:
+            messagebox.showerror("Ошибка анализа", str(job.error))
+            return
+        fs, filter_key, spectra_key = keys
+        decimated, filtered, artifacts, segment_spectra = job.result
+        if fs != self.fs:
+            self.decimated_cache[fs] = decimated
+        if filtered is not None:
+            self.filtered_cache[filter_key] = filtered
+        if artifacts is not None:
+            self.artifact_cache = artifacts
+        if segment_spectra is not None:
+            self.segment_spectra_cache[spectra_key] = segment_spectra
+        retry()
+
+    def make_filter(self, fs, filter_mode):
+        """Потоковый фильтр режима filter_mode; режекция выше Найквиста пропускается"""
+        highpass, lowpass, notch = filter_mode
+        if notch is not None and notch >= fs / 2:
+            notch = None
+        return SosFilter(design_filter_sos(fs, highpass, lowpass, notch))
+
+    def describe_filter(self, fs, filter_mode):
+        """Строка отчета о фильтрации перед анализом"""
+        if filter_mode is None:
+            return "Фильтрация: нет\n"
+        highpass, lowpass, notch = filter_mode
+        parts = [f"ФВЧ {highpass:g} Гц"] if highpass else []
+        if lowpass:
+            parts.append(f"ФНЧ {lowpass:g} Гц")
+        if notch and notch < fs / 2:
+            parts.append(f"режекция {notch:g} Гц")
+        return f"Фильтрация: {', '.join(parts)} (Баттерворт 4-го порядка, каузально)\n"
+
+    def compute_psd(self, signal, fs):
+        """Вычисление СПМ методом периодограммы с окном Ханна"""
+        return compute_psd(signal, fs, self.fft_mode)
+
+    def compute_band_power(self, psd, freqs, f_low, f_high):
+        """Вычисление мощности в заданном частотном диапазоне"""
+        return compute_band_power(psd, freqs, f_low, f_high)
+
+    def start_analysis_pool(self):
+        """Запуск постоянного пула процессов для поканального анализа"""
+        try:
+            self.pool = AnalysisPool()
+        except (OSError, NotImplementedError) as e:
+            print(f"Пул процессов недоступен, анализ в основном потоке: {e}")
+            self.pool = None
+
+    def on_close(self):
+        self.playback.stop()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.root.destroy()
 
-    # Остальные методы (analyze_data, update_plots, save_results) остаются без изменений
     def analyze_data(self, analysis_type):
         if self.data is None:
             return
@@ -544,13 +1695,95 @@ class EEGAnalyzerApp:
         self.current_view = 'analysis'
 
         try:
-            fs = self.fs
+            # Уэлч и выделенный участок - по накопленным периодограммам сегментов, без новых БПФ.
+            # Недостающие данные готовятся в фоне, анализ продолжится по их готовности
+            region = self.region if self.limit_to_region else None
+            welch = self.psd_method == 'welch' or region is not None
+            if not self.analysis_ready(welch, lambda: self.analyze_data(analysis_type)):
+                return
+
+            data, fs = self.get_analysis_data()
+            settings = self.analysis_settings(welch)
+            zoom_band = (0.0, self.delta_view_max()) if analysis_type == 'delta' else None
+            job_args = (fs, zoom_band, self.zoom_oversample, self.fft_mode)
+            channels = range(len(self.channel_names))
+
+            # Незавершенный предыдущий анализ больше не нужен
+            if self.analysis_batch is not None:
+                self.analysis_batch.cancel()
+                self.analysis_batch = None
+
+            if welch:
+                results, segments = self.stored_spectra(settings['segment_spectra'], region)
+                self.finish_analysis(analysis_type, settings, results, segments, region)
+                return
+
+            if self.pool is None:
+                results = {i: channel_spectra(data[:, i], *job_args) for i in channels}
+                self.finish_analysis(analysis_type, settings, results)
+                return
+
+            # Каналы считаются параллельно, результаты забираются в потоке Tk
+            self.analysis_batch = self.pool.map_channels(data, channel_spectra, channels, *job_args)
+            self.results_label.config(text=f"АНАЛИЗ: 0/{len(self.channel_names)} каналов...")
+            self.root.after(20, self.poll_analysis, self.analysis_batch, analysis_type, settings)
+
+        except Exception as e:
+            messagebox.showerror("Ошибка анализа", str(e))
+
+    def poll_analysis(self, batch, analysis_type, settings):
+        """Забирает готовые поканальные результаты из пула процессов"""
+        if batch is not self.analysis_batch:
+            return
+
+        try:
+            if batch.poll():
+                self.results_label.config(
+                    text=f"АНАЛИЗ: {len(batch.results)}/{len(self.channel_names)} каналов...")
+        except Exception as e:
+            self.analysis_batch = None
+            messagebox.showerror("Ошибка анализа", str(e))
+            return
+
+        if batch.done():
+            self.analysis_batch = None
+            self.finish_analysis(analysis_type, settings, batch.results)
+        else:
+            self.root.after(20, self.poll_analysis, batch, analysis_type, settings)
+
+    def analysis_settings(self, with_spectra):
+        """Снимок настроек, по которым посчитаны спектры анализа
+
+        Отчет и его повтор при смене диапазонов ритмов берут настройки отсюда, а не из текущих полей,
+        которые могли измениться после анализа. Для Уэлча здесь же хранятся периодограммы сегментов.
+        """
+        data, fs = self.get_analysis_data()
+        return {'fs': fs, 'n_samples': len(data), 'filter_mode': self.filter_mode, 'fft_mode': self.fft_mode,
+                'reject_artifacts': self.reject_artifacts, 'segment_seconds': self.welch_segment_seconds,
+                'decimator': self.decimated_cache[fs][1] if fs != self.fs else None,
+                'segment_spectra': self.get_segment_spectra() if with_spectra else None}
+
+    def finish_analysis(self, analysis_type, settings, results, segments=None, region=None):
+        """Формирует текст результатов и графики по спектрам всех каналов
+
+        settings - снимок настроек анализа (analysis_settings); segments - диапазон сегментов Уэлча,
+        если спектры взяты из накопленных периодограмм.
+        """
+        fs = settings['fs']
+        try:
             powers = []
             all_psd_data = []
             all_freqs_data = []
 
+            # Накопленные интегралы спектров: при смене диапазонов мощности пересчитываются без БПФ
+            if self.band_integrals is None or self.band_integrals[0] is not results:
+                self.band_integrals = (results, {i: SpectrumIntegral(spectra[1], spectra[0])
+                                                 for i, spectra in results.items() if spectra[0] is not None})
+            integrals = self.band_integrals[1]
+            self.shown_analysis = (self.finish_analysis, (analysis_type, settings, results, segments, region))
+
             if analysis_type == 'delta':
-                results_text = "РЕЗУЛЬТАТЫ АНАЛИЗА СПМ ДЕЛЬТА-РИТМА (0.5-3 Гц)\n"
+                results_text = f"РЕЗУЛЬТАТЫ АНАЛИЗА СПМ ДЕЛЬТА-РИТМА ({self.band_range('delta')} Гц)\n"
                 freq_range = self.freq_bands['delta']
                 self.results_label.config(text="РЕЗУЛЬТАТЫ АНАЛИЗА ДЕЛЬТА-РИТМА:")
             else:
@@ -565,89 +1798,73 @@ class EEGAnalyzerApp:
             results_text += f"  Альфа (α): {self.freq_bands['alpha'][0]}-{self.freq_bands['alpha'][1]} Гц\n"
             results_text += f"  Бета (β): {self.freq_bands['beta'][0]}-{self.freq_bands['beta'][1]} Гц\n"
             results_text += f"  Гамма (γ): {self.freq_bands['gamma'][0]}-{self.freq_bands['gamma'][1]} Гц\n"
+            decimator = settings['decimator']
+            if decimator is not None:
+                results_text += (f"Децимация: {self.fs} → {fs} Гц (×{decimator.factor}), "
+                                 f"пульсации 0-{decimator.passband:g} Гц: {decimator.passband_ripple_db:.3f} дБ\n")
+            results_text += self.describe_filter(fs, settings['filter_mode'])
+            n_samples = settings['n_samples']
+            if segments is not None:
+                nperseg = settings['segment_spectra'].nperseg
+                nfft = next_fast_len(nperseg)
+                if region is not None:
+                    results_text += f"Участок: {region[0]:.2f}-{region[1]:.2f} сек ({region[1] - region[0]:.2f} сек)\n"
+                results_text += (f"Метод: Уэлч, сегмент {settings['segment_seconds']} сек, перекрытие 50%, "
+                                 f"сегментов: {segments[1] - segments[0]}\n")
+                results_text += self.artifact_summary(settings['reject_artifacts'])
+                results_text += f"Длина БПФ сегмента: {nfft} (сегмент {nperseg} отсчетов)"
+            else:
+                nfft = plan_fft_length(n_samples, settings['fft_mode'])
+                results_text += "Метод: периодограмма с окном Ханна по всей записи\n"
+                if settings['reject_artifacts']:
+                    results_text += "Исключение артефактов применяется только в методе Уэлча\n"
+                results_text += f"Длина БПФ: {nfft} (отсчетов в записи: {n_samples})"
+            results_text += f", шаг по частоте: {fs / nfft:.5f} Гц\n"
             results_text += "=" * 70 + "\n\n"
 
-            # Анализируем каждый канал
             for i, name in enumerate(self.channel_names):
-                signal = self.data[:, i]
-
-                # Используем весь сигнал
-                if len(signal) > 0:
-                    # Убираем постоянную составляющую (DC offset)
-                    signal = signal - np.mean(signal)
-
-                    N = len(signal)
+                freqs_positive, psd_positive, zoom_freqs, zoom_psd_values = results[i]
 
-                    # Применяем окно Ханна для уменьшения утечки спектра
-                    window = np.hanning(N)
-                    signal_windowed = signal * window
-
-                    # Вычисление СПМ с нормализацией
-                    fft_result = np.fft.fft(signal_windowed)
-
-                    # Расчет СПМ
-                    psd = (np.real(fft_result) ** 2 + np.imag(fft_result) ** 2)
-                    psd = psd / (fs * np.sum(window ** 2))
-
-                    frequencies = np.fft.fftfreq(N, 1 / fs)
+                if freqs_positive is None:
+                    powers.append(0)
+                    all_psd_data.append(None)
+                    all_freqs_data.append(None)
+                    results_text += f"🔹 {name}: Нет данных\n"
+                    continue
 
-                    # Сохраняем данные для построения графиков
-                    positive_idx = frequencies >= 0
-                    freqs_positive = frequencies[positive_idx]
-                    psd_positive = psd[positive_idx]
+                # Мощность в выбранном диапазоне
+                power = integrals[i].band_power(*freq_range)
+                powers.append(power)
 
+                if analysis_type == 'delta':
+                    # Для графика и пиковой частоты используем zoom-спектр, если он покрывает
+                    # дельта-диапазон (границы могли расшириться после анализа), иначе полный спектр
+                    if zoom_freqs is None or zoom_freqs[-1] < freq_range[1]:
+                        zoom_freqs, zoom_psd_values = freqs_positive, psd_positive
+                    all_psd_data.append(zoom_psd_values)
+                    all_freqs_data.append(zoom_freqs)
+
+                    delta_mask = (zoom_freqs >= freq_range[0]) & (zoom_freqs <= freq_range[1])
+                    if np.any(delta_mask):
+                        peak_freq = zoom_freqs[delta_mask][np.argmax(zoom_psd_values[delta_mask])]
+                        results_text += f"🔹 {name}: {power:.2f} мкВ²/Гц (пик {peak_freq:.3f} Гц)\n"
+                    else:
+                        results_text += f"🔹 {name}: {power:.2f} мкВ²/Гц (диапазон уже шага по частоте)\n"
+                else:
                     all_psd_data.append(psd_positive)
                     all_freqs_data.append(freqs_positive)
 
-                    # Мощность в выбранном диапазоне
-                    freq_mask = (freqs_positive >= freq_range[0]) & (freqs_positive <= freq_range[1])
-                    power = np.trapezoid(psd_positive[freq_mask], freqs_positive[freq_mask])
+                    # Для полного спектра показываем мощность всех ритмов
+                    band_powers = {band: integrals[i].band_power(f_low, f_high)
+                                   for band, (f_low, f_high) in self.freq_bands.items()}
 
-                    powers.append(power)
+                    results_text += f"🔹 {name}:\n"
+                    results_text += (f"   Δ: {band_powers['delta']:6.2f} | θ: {band_powers['theta']:6.2f} | "
+                                     f"α: {band_powers['alpha']:6.2f} | β: {band_powers['beta']:6.2f} | "
+                                     f"γ: {band_powers['gamma']:6.2f} мкВ²/Гц\n")
 
-                    if analysis_type == 'delta':
-                        results_text += f"🔹 {name}: {power:.2f} мкВ²/Гц\n"
-                    else:
-                        # Для полного спектра показываем мощность всех ритмов
-                        delta_power = np.trapezoid(
-                            psd_positive[(freqs_positive >= self.freq_bands['delta'][0]) &
-                                         (freqs_positive <= self.freq_bands['delta'][1])],
-                            freqs_positive[(freqs_positive >= self.freq_bands['delta'][0]) &
-                                           (freqs_positive <= self.freq_bands['delta'][1])]
-                        )
-                        theta_power = np.trapezoid(
-                            psd_positive[(freqs_positive >= self.freq_bands['theta'][0]) &
-                                         (freqs_positive <= self.freq_bands['theta'][1])],
-                            freqs_positive[(freqs_positive >= self.freq_bands['theta'][0]) &
-                                           (freqs_positive <= self.freq_bands['theta'][1])]
-                        )
-                        alpha_power = np.trapezoid(
-                            psd_positive[(freqs_positive >= self.freq_bands['alpha'][0]) &
-                                         (freqs_positive <= self.freq_bands['alpha'][1])],
-                            freqs_positive[(freqs_positive >= self.freq_bands['alpha'][0]) &
-                                           (freqs_positive <= self.freq_bands['alpha'][1])]
-                        )
-                        beta_power = np.trapezoid(
-                            psd_positive[(freqs_positive >= self.freq_bands['beta'][0]) &
-                                         (freqs_positive <= self.freq_bands['beta'][1])],
-                            freqs_positive[(freqs_positive >= self.freq_bands['beta'][0]) &
-                                           (freqs_positive <= self.freq_bands['beta'][1])]
-                        )
-                        gamma_power = np.trapezoid(
-                            psd_positive[(freqs_positive >= self.freq_bands['gamma'][0]) &
-                                         (freqs_positive <= self.freq_bands['gamma'][1])],
-                            freqs_positive[(freqs_positive >= self.freq_bands['gamma'][0]) &
-                                           (freqs_positive <= self.freq_bands['gamma'][1])]
-                        )
-
-                        results_text += f"🔹 {name}:\n"
-                        results_text += f"   Δ: {delta_power:6.2f} | θ: {theta_power:6.2f} | α: {alpha_power:6.2f} | β: {beta_power:6.2f} | γ: {gamma_power:6.2f} мкВ²/Гц\n"
-
-                else:
-                    powers.append(0)
-                    all_psd_data.append(None)
-                    all_freqs_data.append(None)
-                    results_text += f"🔹 {name}: Нет данных\n"
+            if segments is not None:
+                results_text += self.epoch_table(analysis_type, settings['segment_spectra'], segments)
 
             # Добавляем итоговую информацию
             results_text += "\n" + "=" * 70 + "\n"
@@ -659,6 +1876,7 @@ class EEGAnalyzerApp:
                 results_text += f"ОБЩАЯ МОЩНОСТЬ СПЕКТРА (0.5-45 Гц): {np.mean(powers):.2f} мкВ²/Гц\n"
 
             # Обновляем текстовое поле
+            self.results_text.delete(1.0, tk.END)
             self.results_text.insert(1.0, results_text)
 
             # Строим графики
@@ -667,104 +1885,294 @@ class EEGAnalyzerApp:
         except Exception as e:
             messagebox.showerror("Ошибка анализа", str(e))
 
-    def update_plots(self, powers, all_psd_data, all_freqs_data, analysis_type):
-        # Очищаем все графики
-        self.ax_hist.clear()
-        for ax in self.ax_psd:
-            ax.clear()
+    def stored_spectra(self, segment_spectra, region=None):
+        """Поканальные спектры Уэлча участка (сек) или всей записи из накопленных периодограмм
 
-        # График 1: Гистограмма (верхний график)
+        Возвращает (результаты в формате channel_spectra по каналам, (первый, последний + 1) сегмент).
+        """
+        channels = range(len(self.channel_names))
+        if len(segment_spectra) == 0:
+            return {i: (None, None, None, None) for i in channels}, (0, 0)
+        if region is None:
+            first, last = 0, len(segment_spectra)
+        else:
+            fs = segment_spectra.fs
+            first, last = segment_spectra.segment_range(region[0] * fs, region[1] * fs)
+        if segment_spectra.segment_count(first, last) == 0:
+            raise ValueError("Все сегменты исключены как артефакты")
+        psd = segment_spectra.psd(first, last)
+        return {i: (segment_spectra.freqs, psd[i], None, None) for i in channels}, (first, last)
+
+    def epoch_table(self, analysis_type, segment_spectra, segments):
+        """Таблица мощностей по эпохам диапазона сегментов: по разностям накопленных сумм, без БПФ"""
+        fs, step = segment_spectra.fs, segment_spectra.step
+        first, last = segments
+        start = first * step
+        stop = (last - 1) * step + segment_spectra.nperseg
+        epoch = self.epoch_table_seconds * fs
+        n_epochs = int(np.ceil((stop - start) / epoch))
+        if n_epochs > self.epoch_table_rows:
+            # Длинная запись: эпохи укрупняются до заданного числа строк
+            epoch *= int(np.ceil(n_epochs / self.epoch_table_rows))
+            n_epochs = int(np.ceil((stop - start) / epoch))
+        if n_epochs < 2:
+            return ""
+
+        edges = np.minimum(start + np.arange(n_epochs + 1) * epoch, stop)
+        psd = segment_spectra.psd(*segment_spectra.segment_ranges(edges[:-1], edges[1:]))
+        freqs = segment_spectra.freqs
+
+        def cell(value):
+            return f"{value:7.2f}" if np.isfinite(value) else f"{'—':>7}"
+
+        text = f"\nМОЩНОСТЬ ПО ЭПОХАМ ({epoch / fs:g} сек, мкВ²/Гц)\n"
         if analysis_type == 'delta':
-            title = 'Мощность дельта-ритма по каналам (0.5-3 Гц)'
-            ylabel = 'Мощность (мкВ²/Гц)'
+            power = self.compute_band_power(psd, freqs, *self.freq_bands['delta'])
+            names = self.channel_names
         else:
-            title = 'Общая мощность спектра по каналам (0.5-45 Гц)'
-            ylabel = 'Мощность (мкВ²/Гц)'
+            # Полный спектр: ритмы, усредненные по каналам
+            power = np.stack([np.mean(self.compute_band_power(psd, freqs, f_low, f_high)[:, :len(self.channel_names)],
+                                      axis=1) for f_low, f_high in self.freq_bands.values()], axis=1)
+            names = ['Δ', 'θ', 'α', 'β', 'γ']
+        text += "-" * 70 + "\n"
+        text += f"{'Время, сек':>15} " + " ".join(f"{name:>7}" for name in names) + "\n"
+        for t0, t1, row in zip(edges[:-1] / fs, edges[1:] / fs, power):
+            text += f"{t0:7.0f}-{t1:<7.0f} " + " ".join(cell(v) for v in row[:len(names)]) + "\n"
+        return text
+
+    def get_cross_spectra(self, segment_spectra):
+        """Матрица взаимных спектров 0-50 Гц по периодограммам сегментов (кэшируется для записи)"""
+        key = (segment_spectra.fs, self.filter_mode, segment_spectra.nperseg, self.reject_artifacts)
+        if key not in self.csd_cache:
+            # Те же БПФ сегментов, что и у периодограмм: матрица накоплена при их расчете
+            freqs, csd = segment_spectra.cross_spectra()
+            if freqs is None:
+                raise ValueError("Нет сегментов Уэлча без артефактов")
+
+            self.csd_cache[key] = (freqs, csd)
+        return self.csd_cache[key]
+
+    def band_coherence(self, freqs, csd):
+        """Когерентность по ритмам: по усредненной в диапазоне матрице взаимных спектров"""
+        band_coherence = {}
+        for band, (f_low, f_high) in self.freq_bands.items():
+            band_csd = band_average_csd(csd, freqs, f_low, f_high)
+            band_coherence[band] = (band_csd,) + coherence_from_csd(band_csd)
+        return band_coherence
+
+    def analyze_coherence(self):
+        """Когерентность и мнимая когерентность для теменно-затылочных пар электродов"""
+        if self.data is None:
+            return
 
-        bars = self.ax_hist.bar(self.channel_names, powers,
-                                color='skyblue', edgecolor='navy')
-        self.ax_hist.set_title(title, fontweight='bold', fontsize=14)
-        self.ax_hist.set_ylabel(ylabel, fontsize=12)
-        self.ax_hist.grid(True, alpha=0.3)
+        self.show_analysis_view()
+        self.current_view = 'analysis'
 
-        # Добавляем значения на столбцы гистограммы
-        for bar, power in zip(bars, powers):
-            self.ax_hist.text(bar.get_x() + bar.get_width() / 2,
-                              bar.get_height() + max(powers) * 0.01,
-                              f'{power:.2f}', ha='center', va='bottom', fontsize=11)
+        try:
+            if not self.analysis_ready(True, self.analyze_coherence):
+                return
+            settings = self.analysis_settings(True)
+            freqs, csd = self.get_cross_spectra(settings['segment_spectra'])
+            self.show_coherence(settings, freqs, csd)
+        except Exception as e:
+            messagebox.showerror("Ошибка анализа", str(e))
 
-        # Графики 2-7: СПМ для каждого канала
-        colors = ['red', 'blue', 'green', 'orange', 'purple', 'brown']
+    def show_coherence(self, settings, freqs, csd):
+        """Текст и графики когерентности; при смене диапазонов повторяется по той же матрице взаимных спектров"""
+        try:
+            band_coherence = self.band_coherence(freqs, csd)
+            self.shown_analysis = (self.show_coherence, (settings, freqs, csd))
+            coherence, imag_coherence = coherence_from_csd(csd)
+            pairs = [(self.channel_names.index(a), self.channel_names.index(b)) for a, b in self.coherence_pairs]
 
-        for i, (ax, name, color) in enumerate(zip(self.ax_psd, self.channel_names, colors)):
-            if all_psd_data[i] is not None and all_freqs_data[i] is not None:
-                # Рисуем график СПМ
-                ax.plot(all_freqs_data[i], all_psd_data[i], color=color, linewidth=1)
+            results_text = "КОГЕРЕНТНОСТЬ ТЕМЕННО-ЗАТЫЛОЧНЫХ ПАР (Уэлч, "
+            results_text += f"сегмент {settings['segment_seconds']} сек, перекрытие 50%)\n"
+            results_text += "=" * 70 + "\n"
+            results_text += "Coh - квадрат когерентности, iCoh - мнимая часть когерентности\n"
+            results_text += self.describe_filter(settings['fs'], settings['filter_mode'])
+            results_text += self.artifact_summary(settings['reject_artifacts'])
+            results_text += "=" * 70 + "\n\n"
 
-                if analysis_type == 'delta':
-                    ax.set_xlim(0, 6)
-                    # Подсвечиваем дельта-диапазон
-                    delta_mask = (all_freqs_data[i] >= self.freq_bands['delta'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['delta'][1])
-                    ax.fill_between(all_freqs_data[i][delta_mask],
-                                    all_psd_data[i][delta_mask],
-                                    alpha=0.3, color=color)
-                    ax.set_title(f'{name} - Δ: {powers[i]:.2f}', fontsize=12, fontweight='bold')
-
-                    # Вертикальные линии для дельта-ритма
-                    ax.axvline(x=self.freq_bands['delta'][0], color='gray', linestyle='--', alpha=0.7)
-                    ax.axvline(x=self.freq_bands['delta'][1], color='gray', linestyle='--', alpha=0.7)
-                else:
-                    ax.set_xlim(0, 50)
-                    # Подсвечиваем все основные ритмы с новыми диапазонами
-                    delta_mask = (all_freqs_data[i] >= self.freq_bands['delta'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['delta'][1])
-                    theta_mask = (all_freqs_data[i] >= self.freq_bands['theta'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['theta'][1])
-                    alpha_mask = (all_freqs_data[i] >= self.freq_bands['alpha'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['alpha'][1])
-                    beta_mask = (all_freqs_data[i] >= self.freq_bands['beta'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['beta'][1])
-                    gamma_mask = (all_freqs_data[i] >= self.freq_bands['gamma'][0]) & (
-                            all_freqs_data[i] <= self.freq_bands['gamma'][1])
-
-                    ax.fill_between(all_freqs_data[i][delta_mask], all_psd_data[i][delta_mask], alpha=0.3, color='red',
-                                    label='Δ')
-                    ax.fill_between(all_freqs_data[i][theta_mask], all_psd_data[i][theta_mask], alpha=0.3, color='blue',
-                                    label='θ')
-                    ax.fill_between(all_freqs_data[i][alpha_mask], all_psd_data[i][alpha_mask], alpha=0.3,
-                                    color='green', label='α')
-                    ax.fill_between(all_freqs_data[i][beta_mask], all_psd_data[i][beta_mask], alpha=0.3, color='orange',
-                                    label='β')
-                    ax.fill_between(all_freqs_data[i][gamma_mask], all_psd_data[i][gamma_mask], alpha=0.3,
-                                    color='purple', label='γ')
-
-                    ax.set_title(f'{name} - Полный спектр', fontsize=12, fontweight='bold')
-                    ax.legend(fontsize=8)
-
-                # Безопасное вычисление максимума для оси Y
-                if analysis_type == 'delta':
-                    mask = all_freqs_data[i] <= 6
-                else:
-                    mask = all_freqs_data[i] <= 50
+            for (a, b), (i, j) in zip(self.coherence_pairs, pairs):
+                results_text += f"🔹 {a}–{b}:\n"
+                for band, (_, band_coh, band_icoh) in band_coherence.items():
+                    results_text += f"   {band:>5}: Coh {band_coh[i, j]:.3f} | iCoh {band_icoh[i, j]:+.3f}\n"
+                results_text += "\n"
+
+            self.results_label.config(text="РЕЗУЛЬТАТЫ АНАЛИЗА КОГЕРЕНТНОСТИ:")
+            self.results_text.delete(1.0, tk.END)
+            self.results_text.insert(1.0, results_text)
+
+            self.update_coherence_plots(freqs, coherence, imag_coherence, band_coherence, pairs)
+
+        except Exception as e:
+            messagebox.showerror("Ошибка анализа", str(e))
+
+    def update_coherence_plots(self, freqs, coherence, imag_coherence, band_coherence, pairs):
+        # Когерентность строится на тех же осях; художники спектров будут созданы заново
+        self.spectrum_panels = None
+        self.ax_hist.clear()
+        for ax in self.ax_psd:
+            ax.clear()
 
-                if len(all_psd_data[i][mask]) > 0:
-                    y_max = max(all_psd_data[i][mask]) * 1.1
-                    ax.set_ylim(0, y_max)
+        # Верхний график: когерентность по ритмам для каждой пары
+        bands = list(self.freq_bands)
+        width = 0.8 / len(pairs)
+        x = np.arange(len(bands))
+        for k, ((a, b), (i, j)) in enumerate(zip(self.coherence_pairs, pairs)):
+            values = [band_coherence[band][1][i, j] for band in bands]
+            self.ax_hist.bar(x + (k - (len(pairs) - 1) / 2) * width, values, width, label=f'{a}–{b}')
+        self.ax_hist.set_xticks(x)
+        self.ax_hist.set_xticklabels(bands)
+        self.ax_hist.set_ylim(0, 1)
+        self.ax_hist.set_title('Когерентность по ритмам', fontweight='bold', fontsize=14)
+        self.ax_hist.set_ylabel('Coh', fontsize=12)
+        self.ax_hist.grid(True, alpha=0.3)
+        self.ax_hist.legend(fontsize=9)
+
+        # Первая строка: когерентность, вторая: мнимая когерентность
+        for k, ((a, b), (i, j)) in enumerate(zip(self.coherence_pairs, pairs)):
+            ax_coh, ax_icoh = self.ax_psd[k], self.ax_psd[k + 3]
+
+            ax_coh.plot(freqs, coherence[:, i, j], color='teal', linewidth=1)
+            ax_coh.set_ylim(0, 1)
+            ax_coh.set_title(f'{a}–{b} - когерентность', fontsize=12, fontweight='bold')
+
+            ax_icoh.plot(freqs, imag_coherence[:, i, j], color='purple', linewidth=1)
+            ax_icoh.axhline(0, color='gray', linewidth=0.8)
+            ax_icoh.set_ylim(-1, 1)
+            ax_icoh.set_title(f'{a}–{b} - мнимая когерентность', fontsize=12, fontweight='bold')
 
+            for ax in (ax_coh, ax_icoh):
+                ax.set_xlim(0, 50)
                 ax.set_xlabel('Частота (Гц)', fontsize=10)
-                ax.set_ylabel('СПМ (мкВ²/Гц)', fontsize=10)
                 ax.grid(True, alpha=0.3)
 
-            else:
-                ax.text(0.5, 0.5, 'Нет данных', ha='center', va='center',
-                        transform=ax.transAxes, fontsize=12)
-                ax.set_title(f'{name} - Нет данных', fontsize=10)
-
-        # Обновляем canvas
         self.fig.tight_layout()
         self.canvas.draw()
 
+    def build_spectrum_artists(self):
+        """Постоянные художники сетки анализа: столбцы с подписями, кривые СПМ, заливки ритмов"""
+        self.ax_hist.clear()
+        for ax in self.ax_psd:
+            ax.clear()
+
+        self.hist_bars = self.ax_hist.bar(self.channel_names, np.zeros(len(self.channel_names)),
+                                          color='skyblue', edgecolor='navy')
+        self.hist_labels = [self.ax_hist.text(bar.get_x() + bar.get_width() / 2, 0, '',
+                                              ha='center', va='bottom', fontsize=11)
+                            for bar in self.hist_bars]
+        # Заголовки с текстом-заполнителем, чтобы раскладка оставила под них место
+        self.hist_title = self.ax_hist.set_title('Мощность', fontweight='bold', fontsize=14)
+        self.ax_hist.set_ylabel('Мощность (мкВ²/Гц)', fontsize=12)
+        self.ax_hist.grid(True, alpha=0.3)
+
+        colors = ['red', 'blue', 'green', 'orange', 'purple', 'brown']
+        band_styles = [('delta', 'red', 'Δ'), ('theta', 'blue', 'θ'), ('alpha', 'green', 'α'),
+                       ('beta', 'orange', 'β'), ('gamma', 'purple', 'γ')]
+        self.spectrum_panels = []
+        for ax, color, name in zip(self.ax_psd, colors, self.channel_names):
+            line, = ax.plot([], [], color=color, linewidth=1)
+            # Заливка дельта-диапазона (вид дельта-ритма) и всех ритмов (полный спектр)
+            delta_fill = ax.add_patch(Polygon(np.zeros((1, 2)), closed=True, alpha=0.3, color=color))
+            band_fills = {band: ax.add_patch(Polygon(np.zeros((1, 2)), closed=True, alpha=0.3,
+                                                     color=band_color, label=label))
+                          for band, band_color, label in band_styles}
+            edges = [ax.axvline(x=0, color='gray', linestyle='--', alpha=0.7) for _ in range(2)]
+            legend = ax.legend(handles=list(band_fills.values()), fontsize=8)
+            no_data = ax.text(0.5, 0.5, 'Нет данных', ha='center', va='center',
+                              transform=ax.transAxes, fontsize=12)
+            title = ax.set_title(name, fontsize=12, fontweight='bold')
+            ax.set_xlabel('Частота (Гц)', fontsize=10)
+            ax.set_ylabel('СПМ (мкВ²/Гц)', fontsize=10)
+            ax.grid(True, alpha=0.3)
+            self.spectrum_panels.append({'ax': ax, 'line': line, 'delta_fill': delta_fill,
+                                         'band_fills': band_fills, 'edges': edges, 'legend': legend,
+                                         'no_data': no_data, 'title': title})
+
+        # Раскладка считается один раз для сетки с подписями, дальше - только при изменении размеров
+        self.layout_pad = 1.08
+        self.fig.tight_layout(pad=self.layout_pad)
+
+    def update_plots(self, powers, all_psd_data, all_freqs_data, analysis_type):
+        """Обновление графиков анализа: данные готовых художников меняются на месте"""
+        if self.spectrum_panels is None:
+            self.build_spectrum_artists()
+
+        # График 1: Гистограмма (верхний график)
+        if analysis_type == 'delta':
+            self.hist_title.set_text(f"Мощность дельта-ритма по каналам ({self.band_range('delta')} Гц)")
+        else:
+            self.hist_title.set_text('Общая мощность спектра по каналам (0.5-45 Гц)')
+
+        # Высоты столбцов и подписи значений
+        label_offset = np.max(powers) * 0.01
+        for bar, label, power in zip(self.hist_bars, self.hist_labels, powers):
+            bar.set_height(power)
+            label.set_y(power + label_offset)
+            label.set_text(f'{power:.2f}')
+        self.ax_hist.set_ylim(0, max(np.max(powers) * 1.15, 1e-12))
+
+        # Графики 2-7: СПМ для каждого канала
+        f_max = self.delta_view_max() if analysis_type == 'delta' else self.band_max_freq
+        delta_low, delta_high = self.freq_bands['delta']
+
+        for i, (panel, name) in enumerate(zip(self.spectrum_panels, self.channel_names)):
+            ax = panel['ax']
+            has_data = all_psd_data[i] is not None and all_freqs_data[i] is not None
+            panel['no_data'].set_visible(not has_data)
+            panel['line'].set_visible(has_data)
+            if not has_data:
+                panel['line'].set_data([], [])
+                panel['delta_fill'].set_visible(False)
+                for fill in panel['band_fills'].values():
+                    fill.set_visible(False)
+                for edge in panel['edges']:
+                    edge.set_visible(False)
+                panel['legend'].set_visible(False)
+                panel['title'].set_text(f'{name} - Нет данных')
+                continue
+
+            # Только видимая полоса, не больше ~2 точек на пиксель ширины графика
+            freqs, psd = spectrum_for_display(all_freqs_data[i], all_psd_data[i], 0, f_max,
+                                              self.points_per_pixel * axes_pixel_width(ax))
+            panel['line'].set_data(freqs, psd)
+            ax.set_xlim(0, f_max)
+
+            delta_view = analysis_type == 'delta'
+            if delta_view:
+                # Подсвечиваем дельта-диапазон и отмечаем его границы
+                self.set_band_fill(panel['delta_fill'], freqs, psd, delta_low, delta_high)
+                for edge, x in zip(panel['edges'], (delta_low, delta_high)):
+                    edge.set_xdata([x, x])
+                for fill in panel['band_fills'].values():
+                    fill.set_visible(False)
+                panel['title'].set_text(f'{name} - Δ: {powers[i]:.2f}')
+            else:
+                # Подсвечиваем все основные ритмы
+                for band, fill in panel['band_fills'].items():
+                    self.set_band_fill(fill, freqs, psd, *self.freq_bands[band])
+                panel['delta_fill'].set_visible(False)
+                panel['title'].set_text(f'{name} - Полный спектр')
+
+            for edge in panel['edges']:
+                edge.set_visible(delta_view)
+            panel['legend'].set_visible(not delta_view)
+
+            # Максимум для оси Y по видимой полосе (огибающая сохраняет пики)
+            if len(psd) > 0:
+                ax.set_ylim(0, np.max(psd) * 1.1)
+
+        # Обновляем canvas (частые правки диапазонов объединяются в одну отрисовку)
+        self.canvas.draw_idle()
+
+    def set_band_fill(self, fill, freqs, psd, f_low, f_high):
+        """Заливка под кривой СПМ в диапазоне f_low-f_high; пустой диапазон скрывается"""
+        band_mask = (freqs >= f_low) & (freqs <= f_high)
+        fill.set_visible(bool(np.any(band_mask)))
+        if np.any(band_mask):
+            fill.set_xy(area_polygon(freqs[band_mask], psd[band_mask]))
+
     def save_results(self):
         file_path = filedialog.asksaveasfilename(
             title="Сохранить результаты",
@@ -779,7 +2187,18 @@ class EEGAnalyzerApp:
 
                 # Также сохраняем график как изображение
                 plot_path = file_path.replace('.txt', '_plot.png')
-                self.fig.savefig(plot_path, dpi=300, bbox_inches='tight')
+                if self.current_view == 'eeg':
+                    if self.fast_trace:
+                        # Экспорт всегда через matplotlib: фигура догоняет текущее окно просмотра
+                        self.eeg_layout = None
+                        self.draw_eeg_figure()
+                    self.eeg_blit.set_animated(False)
+                    try:
+                        self.eeg_fig.savefig(plot_path, dpi=300, bbox_inches='tight')
+                    finally:
+                        self.eeg_blit.set_animated(True)
+                else:
+                    self.fig.savefig(plot_path, dpi=300, bbox_inches='tight')
 
                 messagebox.showinfo("Успех", f"Результаты сохранены!\nТекст: {file_path}\nГрафик: {plot_path}")
             except Exception as e: